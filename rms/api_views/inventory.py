@@ -4,28 +4,51 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http.response import HttpResponse, JsonResponse
 from django.shortcuts import reverse
 from rms import models
-from datetime import datetime
-from django.utils.timezone import localtime, make_aware
+import json
+from datetime import datetime, timedelta
+from django.utils import timezone
+from django.utils.timezone import localtime, make_aware, is_naive
+from django.utils.dateparse import parse_datetime
 from rms.exceptions import *
+from rms.availability import devices_availability, device_usage_buckets, free_windows
+from rms import scans, search, tags
+
+
+def parse_request_date(value):
+    date = parse_datetime(value)
+    if date is None:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    if is_naive(date):
+        date = make_aware(date)
+    return date
 
 
 @login_required
 def tag_search_view(request):
     if 'term' in request.GET:
-        tags = Tag.objects.filter(name__icontains=request.GET['term'])
         return_value = []
-        for tag in tags:
-            return_value.append({'id': tag.name, 'text': tag.name})
+        for tag in tags.search(request.GET['term']):
+            return_value.append({'id': tag['name'], 'text': tag['name'], 'usage': tag['usage']})
         return JsonResponse({'results': return_value}, status=200, safe=False)
     return HttpResponse('', 400)
 
 
+@login_required
+def typeahead_json(request):
+    if 'q' not in request.GET:
+        return HttpResponse('GET parameter "q" required', status=400)
+    try:
+        limit = int(request.GET.get('limit', search.TYPEAHEAD_LIMIT))
+    except ValueError:
+        return HttpResponse('Invalid limit', status=400)
+    return JsonResponse(search.typeahead(request.user, request.GET['q'].strip(), limit), status=200)
+
+
 @csrf_exempt
 @login_required
 def tag_add_view(request):
     if request.method == 'POST' and 'name' in request.POST:
-        tag = Tag(name=request.POST['name'])
-        tag.save()
+        tags.ensure([request.POST['name']])
         return HttpResponse('', 201)
     return HttpResponse('', 400)
 
@@ -101,6 +124,112 @@ def device_reservations_json(request, device_id):
         return HttpResponse('Device not found', status=404)
 
 
+@login_required
+def devices_availability_json(request):
+    if 'start' not in request.GET or 'end' not in request.GET:
+        return HttpResponse('GET required with fields "start" and "end"', status=400)
+    try:
+        start = parse_request_date(request.GET['start'])
+        end = parse_request_date(request.GET['end'])
+        devices = models.Device.objects.filter(active=True)
+        if 'devices' in request.GET:
+            device_ids = [int(device_id) for device_id in request.GET['devices'].split(',') if device_id]
+            devices = devices.filter(id__in=device_ids)
+        elif 'category' in request.GET:
+            if request.GET['category'] == 'uncategorized':
+                devices = devices.filter(category=None)
+            else:
+                devices = devices.filter(category_id=int(request.GET['category']))
+    except ValueError:
+        return HttpResponse('Ungültige Anfrage', status=400)
+    if start >= end:
+        return HttpResponse('Das Ende muss nach dem Start liegen.', status=400)
+    availability = devices_availability(devices, start, end)
+    return JsonResponse({
+        'start': localtime(start).isoformat(),
+        'end': localtime(end).isoformat(),
+        'devices': [{'id': device_id, 'available': available} for device_id, available in availability.items()],
+    }, status=200, safe=False)
+
+
+def day_buckets(start, end):
+    buckets = []
+    day = localtime(start).date()
+    bucket_start = make_aware(datetime.combine(day, datetime.min.time()))
+    while bucket_start < end:
+        day += timedelta(days=1)
+        bucket_end = make_aware(datetime.combine(day, datetime.min.time()))
+        buckets.append((bucket_start, bucket_end))
+        bucket_start = bucket_end
+    return buckets
+
+
+def hour_buckets(start, end):
+    buckets = []
+    bucket_start = start.replace(minute=0, second=0, microsecond=0)
+    while bucket_start < end:
+        buckets.append((bucket_start, bucket_start+timedelta(hours=1)))
+        bucket_start += timedelta(hours=1)
+    return buckets
+
+
+@login_required
+def device_availability_json(request, device_id):
+    try:
+        device = models.Device.objects.get(id=device_id)
+        if 'start' not in request.GET or 'end' not in request.GET:
+            return HttpResponse('GET required with fields "start" and "end"', status=400)
+        try:
+            start = parse_request_date(request.GET['start'])
+            end = parse_request_date(request.GET['end'])
+        except ValueError:
+            return HttpResponse('Ungültiges Datum', status=400)
+        if end-start < timedelta(hours=1) or end-start > timedelta(days=366):
+            return HttpResponse('Der Zeitraum muss zwischen einer Stunde und einem Jahr liegen.', status=400)
+        if request.GET.get('resolution', 'day') == 'hour':
+            buckets = hour_buckets(start, end)
+        else:
+            buckets = day_buckets(start, end)
+        pool, peaks = device_usage_buckets(device, buckets)
+        availability = []
+        for (bucket_start, bucket_end), booked in zip(buckets, peaks):
+            availability.append({
+                'start': localtime(bucket_start).isoformat(),
+                'end': localtime(bucket_end).isoformat(),
+                'booked': booked,
+                'free': pool-booked,
+            })
+        return JsonResponse(availability, status=200, safe=False)
+    except models.Device.DoesNotExist:
+        return HttpResponse('Device not found', status=404)
+
+
+FREE_WINDOWS_HORIZON = timedelta(days=366)
+
+
+@login_required
+def device_free_windows_json(request, device_id):
+    try:
+        device = models.Device.objects.get(id=device_id)
+        try:
+            amount = int(request.GET.get('amount', 1))
+            hours = float(request.GET['duration'])
+            after = parse_request_date(request.GET['after']) if 'after' in request.GET else timezone.now()
+            count = min(int(request.GET.get('count', 5)), 50)
+        except (KeyError, ValueError):
+            return HttpResponse('GET required with fields "duration" (hours) and optional "amount", "after", "count"',
+                                status=400)
+        # checked before building the timedelta, which fails for nan, inf and huge values
+        if amount < 1 or count < 1 or not 0 < hours <= FREE_WINDOWS_HORIZON.total_seconds()/3600:
+            return HttpResponse('Anzahl und Dauer müssen positiv sein, die Dauer darf höchstens ein Jahr betragen.',
+                                status=400)
+        windows = free_windows(device, amount, timedelta(hours=hours), after, count, FREE_WINDOWS_HORIZON)
+        return JsonResponse([{'start': localtime(start).isoformat(), 'end': localtime(end).isoformat()}
+                             for start, end in windows], status=200, safe=False)
+    except models.Device.DoesNotExist:
+        return HttpResponse('Device not found', status=404)
+
+
 @login_required
 def instance_reservations_json(request, instance_id):
     try:
@@ -167,6 +296,95 @@ def add_instance_to_reservation(request, instance_id):
         return HttpResponse('Instanz nicht gefunden.', status=404)
 
 
+def instance_status(inventory_number):
+    instance = models.Instance.objects.select_related('device', 'warehouse').get(inventory_number=inventory_number)
+    checkout = models.ReservationCheckoutInstance.objects.filter(instance=instance).select_related('reservation')\
+        .order_by('-checkout_date').first()
+    # only the reservations of this very instance, a booking of the device may be served by any other instance
+    upcoming = models.Reservation.objects.filter(reservationinstancemembership__instance=instance,
+                                                 end_date__gt=timezone.now())
+    if checkout is not None:
+        upcoming = upcoming.exclude(id=checkout.reservation_id)
+    return instance, checkout, upcoming.order_by('start_date', 'id').first()
+
+
+@login_required
+def instance_by_number_json(request, inventory_number):
+    try:
+        instance, checkout, next_reservation = instance_status(inventory_number)
+    except models.Instance.DoesNotExist:
+        return HttpResponse('Es wurde kein Gerät mit der Inventarnummer "{}" gefunden'.format(inventory_number),
+                            status=404)
+    status = {
+        'id': instance.id,
+        'inventory_number': instance.inventory_number,
+        'serial_number': instance.serial_number,
+        'broken': instance.broken,
+        'rentable': instance.rentable,
+        'active': instance.active,
+        'url': reverse('device_instance', kwargs={'device_id': instance.device_id, 'instance_id': instance.id}),
+        'device': {
+            'id': instance.device.id,
+            'name': instance.device.name,
+            'vendor': instance.device.vendor,
+        },
+        'warehouse': None,
+        'checkout': None,
+        'next_reservation': None,
+    }
+    if instance.warehouse is not None:
+        status['warehouse'] = {'id': instance.warehouse.id, 'name': instance.warehouse.name}
+    if checkout is not None:
+        status['checkout'] = {
+            'date': localtime(checkout.checkout_date).isoformat(),
+            'reservation': {
+                'id': checkout.reservation.id,
+                'full_id': checkout.reservation.full_id,
+                'name': checkout.reservation.name,
+                'end': localtime(checkout.reservation.end_date).isoformat(),
+            }
+        }
+    if next_reservation is not None:
+        status['next_reservation'] = {
+            'id': next_reservation.id,
+            'full_id': next_reservation.full_id,
+            'name': next_reservation.name,
+            'start': localtime(next_reservation.start_date).isoformat(),
+            'end': localtime(next_reservation.end_date).isoformat(),
+        }
+    return JsonResponse(data=status)
+
+
+def parse_cart_lines(body):
+    lines = []
+    for line in json.loads(body.decode('utf-8'))['lines']:
+        if 'device' in line:
+            lines.append({'device': int(line['device']), 'amount': int(line['amount'])})
+        else:
+            lines.append({'instance': int(line['instance'])})
+    return lines
+
+
+@csrf_exempt
+@login_required
+def reservation_cart(request, reservation_id):
+    try:
+        reservation = models.Reservation.objects.get(id=reservation_id)
+        if request.method != 'POST':
+            return HttpResponse('POST required with JSON field "lines"', status=400)
+        try:
+            lines = parse_cart_lines(request.body)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponse('POST required with JSON field "lines"', status=400)
+        try:
+            reservation.add_lines(lines)
+            return HttpResponse('', status=200)
+        except ReservationError as error:
+            return JsonResponse(data=error.get_json_dir(), status=400, safe=False)
+    except models.Reservation.DoesNotExist:
+        return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
+
+
 @csrf_exempt
 @login_required
 def checkout_instance(request, reservation_id):
@@ -184,12 +402,47 @@ def checkout_instance(request, reservation_id):
                 error = ReservationError('Es wurde kein Gerät mit der Inventarnummer "{}" gefunden'
                                          .format(request.POST['inventory_number']), set())
                 return JsonResponse(data=error.get_json_dir(), status=404, safe=False)
+            except LockError as error:
+                return JsonResponse(data=error.get_json_dir(), status=409, safe=False)
             except CheckoutError as error:
                 return JsonResponse(data=error.get_json_dir(), status=400, safe=False)
     except models.Reservation.DoesNotExist:
         return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
 
 
+def parse_inventory_numbers(body):
+    inventory_numbers = [str(inventory_number) for inventory_number in
+                         json.loads(body.decode('utf-8'))['inventory_numbers']]
+    if len(inventory_numbers) > 1000:
+        raise ValueError('Too many inventory numbers')
+    return inventory_numbers
+
+
+@csrf_exempt
+@login_required
+def checkout_instances(request, reservation_id):
+    try:
+        reservation = models.Reservation.objects.get(id=reservation_id)
+        if request.method != 'POST':
+            return HttpResponse('POST required with JSON field "inventory_numbers"', status=400)
+        try:
+            inventory_numbers = parse_inventory_numbers(request.body)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponse('POST required with JSON field "inventory_numbers"', status=400)
+        try:
+            errors = reservation.checkout_instances(inventory_numbers)
+        except LockError as error:
+            return JsonResponse(data=error.get_json_dir(), status=409, safe=False)
+        except CheckoutError as error:
+            return JsonResponse(data=error.get_json_dir(), status=400, safe=False)
+        return JsonResponse(data={'results': [{
+            'inventory_number': inventory_number,
+            'error': error.get_json_dir() if error is not None else None
+        } for inventory_number, error in zip(inventory_numbers, errors)]}, status=200)
+    except models.Reservation.DoesNotExist:
+        return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
+
+
 @csrf_exempt
 @login_required
 def checkin_instance(request, reservation_id):
@@ -209,24 +462,78 @@ def checkin_instance(request, reservation_id):
         return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
 
 
+def parse_checkin(body):
+    data = json.loads(body.decode('utf-8'))
+    if not isinstance(data, dict):
+        raise ValueError('JSON object required')
+    abstract_items = {}
+    for item in data.get('abstract_items', []):
+        abstract_items[str(item['name'])] = abstract_items.get(str(item['name']), 0)+int(item['amount'])
+    # a check-in may return abstract items only
+    if 'inventory_numbers' not in data and 'abstract_items' in data:
+        return [], abstract_items
+    return parse_inventory_numbers(body), abstract_items
+
+
+@csrf_exempt
+@login_required
+def checkin_instances(request, reservation_id):
+    try:
+        reservation = models.Reservation.objects.get(id=reservation_id)
+        if request.method != 'POST':
+            return HttpResponse('POST required with JSON field "inventory_numbers"', status=400)
+        try:
+            inventory_numbers, abstract_items = parse_checkin(request.body)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponse('POST required with JSON field "inventory_numbers"', status=400)
+        errors, leftovers = reservation.checkin_instances(inventory_numbers, abstract_items)
+        return JsonResponse(data={'results': [{
+            'inventory_number': inventory_number,
+            'error': str(error) if error is not None else None
+        } for inventory_number, error in zip(inventory_numbers, errors)], 'abstract_leftovers': leftovers}, status=200)
+    except models.Reservation.DoesNotExist:
+        return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
+
+
+def parse_scan_events(body):
+    events = []
+    for event in json.loads(body.decode('utf-8'))['events']:
+        if event['action'] not in (models.ScanEvent.CHECKOUT, models.ScanEvent.CHECKIN):
+            raise ValueError('Unknown action')
+        if not 0 < len(str(event['id'])) <= 100:
+            raise ValueError('Invalid event id')
+        events.append({'id': str(event['id']), 'action': event['action'],
+                       'inventory_number': str(event['inventory_number']), 'time': parse_request_date(event['time'])})
+    if len(events) > 1000:
+        raise ValueError('Too many events')
+    return events
+
+
+@csrf_exempt
+@login_required
+def sync_scans(request, reservation_id):
+    try:
+        reservation = models.Reservation.objects.get(id=reservation_id)
+        if request.method != 'POST':
+            return HttpResponse('POST required with JSON field "events"', status=400)
+        try:
+            events = parse_scan_events(request.body)
+        except (ValueError, KeyError, TypeError):
+            return HttpResponse('POST required with JSON field "events"', status=400)
+        return JsonResponse(data={'results': scans.sync(reservation, events)}, status=200)
+    except models.Reservation.DoesNotExist:
+        return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
+
+
 @csrf_exempt
 @login_required
 def checkin_abstract_item(request, reservation_id):
     try:
         reservation = models.Reservation.objects.get(id=reservation_id)
         if request.method == 'POST' and 'item_name' in request.POST and 'amount' in request.POST:
-            checkin_amount = int(request.POST.get('amount'))
-            abstract_items = reservation.abstract_items.filter(name=request.POST.get('item_name'))\
-                .order_by('checkout_date').all()
-            for item in abstract_items:
-                if item.amount <= checkin_amount:
-                    checkin_amount -= item.amount
-                    item.delete()
-                else:
-                    item.amount -= checkin_amount
-                    item.save()
-                if checkin_amount == 0:
-                    break
-            return HttpResponse('', status=200)
+            leftovers = reservation.checkin_abstract_items({
+                request.POST.get('item_name'): int(request.POST.get('amount'))
+            })
+            return JsonResponse(data={'leftovers': leftovers}, status=200)
     except models.Reservation.DoesNotExist:
         return HttpResponse('Die Reservierung wurde nicht gefunden.', status=404)
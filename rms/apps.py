@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RmsConfig(AppConfig):
     name = 'rms'
+
+    def ready(self):
+        from rms import signals
@@ -0,0 +1,254 @@
+from collections import namedtuple, defaultdict
+from django.db.models import F, Q, Value, IntegerField, Count
+from psycopg2.extras import DateTimeTZRange
+from rms import models, ledger
+from rms.exceptions import ReservationError
+
+
+Booking = namedtuple('Booking', ['device_id', 'instance_id', 'reservation_id', 'start', 'end', 'amount'])
+
+BOOKING_FIELDS = ('booking_device', 'booking_instance', 'booking_reservation',
+                  'booking_start', 'booking_end', 'booking_amount')
+
+
+def overlapping(start, end, prefix=''):
+    # half-open periods, reservations touching the window at its borders do not collide
+    return Q(**{prefix+'period__overlap': DateTimeTZRange(start, end, '[)')})
+
+
+def rentable_instances(devices):
+    return models.Instance.objects.filter(device__in=devices, rentable=True, active=True)
+
+
+def _booking_values(queryset, device, instance, amount):
+    return queryset.annotate(booking_device=device,
+                             booking_instance=instance,
+                             booking_reservation=F('reservation'),
+                             booking_start=F('reservation__start_date'),
+                             booking_end=F('reservation__end_date'),
+                             booking_amount=amount).values_list(*BOOKING_FIELDS)
+
+
+def load_bookings(devices, start, end):
+    device_bookings = _booking_values(
+        models.ReservationDeviceMembership.objects.filter(overlapping(start, end, 'reservation__'),
+                                                          device__in=devices),
+        F('device'), Value(None, output_field=IntegerField()), F('amount'))
+    instance_bookings = _booking_values(
+        models.ReservationInstanceMembership.objects.filter(overlapping(start, end),
+                                                            instance__in=rentable_instances(devices)),
+        F('instance__device'), F('instance'), Value(1, output_field=IntegerField()))
+    checkout_bookings = _booking_values(
+        models.ReservationCheckoutInstance.objects.filter(overlapping(start, end),
+                                                          instance__in=rentable_instances(devices)),
+        F('instance__device'), F('instance'), Value(1, output_field=IntegerField()))
+    return [Booking(*row) for row in device_bookings.union(instance_bookings, checkout_bookings, all=True)]
+
+
+def sweep(bookings, start, end):
+    events = []
+    for booking in bookings:
+        events.append((max(booking.start, start), 1, booking))
+        events.append((min(booking.end, end), -1, booking))
+    # releases are processed before acquisitions happening at the same time
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    usage = 0
+    peak = 0
+    active = {}
+    peak_reservations = set()
+    for time, direction, booking in events:
+        if direction > 0:
+            usage += booking.amount
+            active[booking.reservation_id] = active.get(booking.reservation_id, 0) + 1
+            if usage > peak:
+                peak = usage
+                peak_reservations = set(active)
+            elif usage == peak:
+                peak_reservations.update(active)
+        else:
+            usage -= booking.amount
+            active[booking.reservation_id] -= 1
+            if active[booking.reservation_id] == 0:
+                del active[booking.reservation_id]
+    return peak, peak_reservations
+
+
+def usage_timeline(bookings, start, end):
+    changes = defaultdict(int)
+    for booking in bookings:
+        changes[max(booking.start, start)] += booking.amount
+        changes[min(booking.end, end)] -= booking.amount
+    # every entry holds the usage from its time up to the time of the next entry
+    timeline = [(start, 0)]
+    usage = 0
+    for time in sorted(changes):
+        usage += changes[time]
+        timeline.append((time, usage))
+    return timeline
+
+
+def bucket_peaks(timeline, buckets):
+    peaks = []
+    index = 0
+    for bucket_start, bucket_end in buckets:
+        while index+1 < len(timeline) and timeline[index+1][0] <= bucket_start:
+            index += 1
+        peak = timeline[index][1]
+        probe = index+1
+        while probe < len(timeline) and timeline[probe][0] < bucket_end:
+            peak = max(peak, timeline[probe][1])
+            probe += 1
+        peaks.append(peak)
+    return peaks
+
+
+def reservations_by_id(reservation_ids):
+    if len(reservation_ids) == 0:
+        return set()
+    return set(models.Reservation.objects.filter(id__in=reservation_ids))
+
+
+def device_availability(device, start, end):
+    pool = rentable_instances([device]).count()
+    if ledger.enabled() and ledger.peak(device, start, end) == 0:
+        return pool, set()
+    peak, reservation_ids = sweep(load_bookings([device], start, end), start, end)
+    return pool - peak, reservations_by_id(reservation_ids)
+
+
+def has_free_units(device, start, end, amount):
+    if ledger.enabled() and rentable_instances([device]).count()-ledger.peak(device, start, end) >= amount:
+        return True, set()
+    available, collisions = device_availability(device, start, end)
+    return available >= amount, collisions
+
+
+def free_windows(device, amount, duration, after, count, horizon):
+    end = after+horizon
+    pool = rentable_instances([device]).count()
+    timeline = usage_timeline(load_bookings([device], after, end), after, end)
+    timeline.append((end, None))
+    windows = []
+    run_start = None
+    for (time, usage), (next_time, next_usage) in zip(timeline, timeline[1:]):
+        if pool-usage >= amount:
+            if run_start is None:
+                run_start = time
+            if next_usage is not None and pool-next_usage >= amount:
+                continue
+            # the free run ends at next_time
+            if next_time-run_start >= duration:
+                windows.append((run_start, run_start+duration))
+                if len(windows) == count:
+                    break
+        run_start = None
+    return windows
+
+
+def free_instances(reservation, instances):
+    # instances reserved by the reservation itself are free for it, the checked out ones are not
+    start = reservation.start_date
+    end = reservation.end_date
+    booked = models.ReservationInstanceMembership.objects.filter(overlapping(start, end))\
+        .exclude(reservation=reservation).values('instance')
+    checked_out = models.ReservationCheckoutInstance.objects.filter(overlapping(start, end)).values('instance')
+    return instances.filter(rentable=True, active=True, broken=False).exclude(id__in=booked).exclude(id__in=checked_out)
+
+
+def devices_availability(devices, start, end):
+    device_ids = list(devices.values_list('id', flat=True))
+    pools = dict(rentable_instances(devices).order_by().values_list('device').annotate(Count('id')))
+    bookings = defaultdict(list)
+    for booking in load_bookings(devices, start, end):
+        bookings[booking.device_id].append(booking)
+    availability = {}
+    for device_id in device_ids:
+        peak, _ = sweep(bookings[device_id], start, end)
+        availability[device_id] = pools.get(device_id, 0) - peak
+    return availability
+
+
+def alternatives(device, start, end, amount, limit=5):
+    tags = device.tags.all()
+    subtree = device.category.subtree_ids() if device.category_id is not None else []
+    candidate_ids = models.Device.objects.filter(Q(tags__in=tags) | Q(category__in=subtree), active=True)\
+        .exclude(id=device.id).values('id')
+    candidates = models.Device.objects.filter(id__in=candidate_ids)
+    availability = devices_availability(candidates, start, end)
+    ranked = [(candidate, availability[candidate.id])
+              for candidate in candidates.annotate(shared_tags=Count('tags', filter=Q(tags__in=tags)))
+              if availability[candidate.id] >= amount]
+    # devices of the same category subtree first, then by shared tags and free units
+    ranked.sort(key=lambda alternative: (alternative[0].category_id not in subtree, -alternative[0].shared_tags,
+                                         -alternative[1], alternative[0].name))
+    return ranked[:limit]
+
+
+def device_usage_buckets(device, buckets):
+    start = buckets[0][0]
+    end = buckets[-1][1]
+    pool = rentable_instances([device]).count()
+    peaks = bucket_peaks(usage_timeline(load_bookings([device], start, end), start, end), buckets)
+    return pool, peaks
+
+
+def free_units(device_ids, start, end):
+    pools = dict(rentable_instances(device_ids).order_by().values_list('device').annotate(Count('id')))
+    bookings = defaultdict(list)
+    booked_instances = defaultdict(set)
+    for booking in load_bookings(device_ids, start, end):
+        bookings[booking.device_id].append(booking)
+        if booking.instance_id is not None:
+            booked_instances[booking.instance_id].add(booking.reservation_id)
+    free = {}
+    peak_reservations = {}
+    for device_id in device_ids:
+        peak, peak_reservations[device_id] = sweep(bookings[device_id], start, end)
+        free[device_id] = pools.get(device_id, 0)-peak
+    return free, peak_reservations, booked_instances
+
+
+def cart_errors(reservation, lines, devices, instances):
+    start = reservation.start_date
+    end = reservation.end_date
+    device_ids = set(devices).union(instance.device_id for instance in instances.values())
+    free, peak_reservations, booked_instances = free_units(device_ids, start, end)
+
+    # every line is checked against the snapshot reduced by the lines accepted before it
+    errors = []
+    carted_instances = set()
+    for line in lines:
+        if 'device' in line:
+            device_id = line['device']
+            if device_id not in devices:
+                errors.append(('Gerät nicht gefunden.', set()))
+            elif line['amount'] < 1:
+                errors.append(('Es wird mindestens ein Gerät benötigt.', set()))
+            elif free[device_id] < line['amount']:
+                errors.append(('Es sind nicht genug Geräte zur ausgewählten Zeit verfügbar.',
+                               peak_reservations[device_id]))
+            else:
+                free[device_id] -= line['amount']
+                errors.append(None)
+        else:
+            instance = instances.get(line['instance'])
+            if instance is None:
+                errors.append(('Instanz nicht gefunden.', set()))
+            elif not instance.rentable or not instance.active or instance.id in carted_instances:
+                errors.append(('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.', set()))
+            elif instance.id in booked_instances:
+                errors.append(('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.',
+                               booked_instances[instance.id]))
+            elif free[instance.device_id] < 1:
+                errors.append(('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.',
+                               peak_reservations[instance.device_id]))
+            else:
+                free[instance.device_id] -= 1
+                carted_instances.add(instance.id)
+                errors.append(None)
+
+    collisions = {reservation.id: reservation
+                  for reservation in reservations_by_id(set().union(*[error[1] for error in errors if error]))}
+    return [ReservationError(error[0], set(collisions[reservation_id] for reservation_id in error[1]))
+            if error is not None else None for error in errors]
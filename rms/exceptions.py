@@ -2,9 +2,10 @@ from django.utils.timezone import localtime
 
 
 class ReservationError(ValueError):
-    def __init__(self, message, collisions):
+    def __init__(self, message, collisions, alternatives=None):
         super(ReservationError, self).__init__(message)
         self.collisions = collisions
+        self.alternatives = alternatives if alternatives is not None else []
 
     def get_json_dir(self):
         json_data = {
@@ -19,6 +20,12 @@ class ReservationError(ValueError):
                 'start': localtime(reservation.start_date).isoformat(),
                 'end': localtime(reservation.end_date).isoformat()
             })
+        json_data['alternatives'] = [{
+            'id': device.id,
+            'name': device.name,
+            'vendor': device.vendor,
+            'available': available
+        } for device, available in self.alternatives]
         return json_data
 
 
@@ -27,6 +34,26 @@ class CheckoutError(ReservationError):
         super(CheckoutError, self).__init__(*args, **kwargs)
 
 
+class CartError(ReservationError):
+    def __init__(self, message, line_errors):
+        collisions = set()
+        for error in line_errors:
+            if error is not None:
+                collisions = collisions.union(error.collisions)
+        super(CartError, self).__init__(message, collisions)
+        self.line_errors = line_errors
+
+    def get_json_dir(self):
+        json_data = super(CartError, self).get_json_dir()
+        json_data['lines'] = [error.get_json_dir() if error is not None else None for error in self.line_errors]
+        return json_data
+
+
+class LockError(ReservationError):
+    def __init__(self, message):
+        super(LockError, self).__init__(message, set())
+
+
 class CheckinError(ValueError):
     def __init__(self, message):
         super(CheckinError, self).__init__(message)
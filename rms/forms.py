@@ -51,10 +51,9 @@ class CategoryForm(BootstrapForm):
 
     def clean_top_category(self):
         new_top_category = self.cleaned_data['top_category']
-        while new_top_category is not None:
-            if new_top_category.id == self.instance.id:
-                raise ValidationError('Category loop not allowed', 'category_loop')
-            new_top_category = new_top_category.top_category
+        if new_top_category is not None and self.instance.id is not None \
+                and self.instance.id in new_top_category.ancestor_ids():
+            raise ValidationError('Category loop not allowed', 'category_loop')
         return self.cleaned_data['top_category']
 
 
@@ -0,0 +1,122 @@
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from rmsv2 import settings
+from rms import models
+
+# The ledger stores for every device and hour the sum of all units booked by reservations touching that hour.
+# Bookings sharing an hour without overlapping are both counted, so the ledger is an upper bound of the real usage.
+
+BOOKINGS_SQL = '''
+    SELECT membership.device_id, reservation.start_date, reservation.end_date, membership.amount
+    FROM {device_membership} membership JOIN {reservation} reservation ON reservation.id = membership.reservation_id
+    UNION ALL
+    SELECT instance.device_id, reservation.start_date, reservation.end_date, 1
+    FROM {instance_membership} membership JOIN {reservation} reservation ON reservation.id = membership.reservation_id
+    JOIN {instance} instance ON instance.id = membership.instance_id
+    UNION ALL
+    SELECT instance.device_id, reservation.start_date, reservation.end_date, 1
+    FROM {checkout} checkout JOIN {reservation} reservation ON reservation.id = checkout.reservation_id
+    JOIN {instance} instance ON instance.id = checkout.instance_id
+'''
+
+EXPECTED_SQL = '''
+    SELECT bookings.device_id, bucket, SUM(bookings.amount) AS booked
+    FROM ({bookings}) AS bookings (device_id, start_date, end_date, amount),
+    generate_series(date_trunc('hour', bookings.start_date), bookings.end_date - interval '1 microsecond',
+                    interval '1 hour') AS bucket
+    GROUP BY bookings.device_id, bucket
+'''
+
+BOOK_SQL = '''
+    INSERT INTO {ledger} (device_id, bucket, booked)
+    SELECT %s, bucket, %s
+    FROM generate_series(date_trunc('hour', %s::timestamptz), %s::timestamptz - interval '1 microsecond',
+                         interval '1 hour') AS bucket
+    ON CONFLICT (device_id, bucket) DO UPDATE SET booked = {ledger}.booked + EXCLUDED.booked
+'''
+
+REBUILD_SQL = '''
+    INSERT INTO {ledger} (device_id, bucket, booked) {expected}
+'''
+
+VERIFY_SQL = '''
+    SELECT COALESCE(ledger.device_id, expected.device_id), COALESCE(ledger.bucket, expected.bucket),
+           COALESCE(ledger.booked, 0), COALESCE(expected.booked, 0)
+    FROM {ledger} ledger FULL OUTER JOIN ({expected}) expected
+    ON ledger.device_id = expected.device_id AND ledger.bucket = expected.bucket
+    WHERE COALESCE(ledger.booked, 0) <> COALESCE(expected.booked, 0)
+    ORDER BY 1, 2
+'''
+
+
+def enabled():
+    return settings.AVAILABILITY_LEDGER
+
+
+def _sql(template):
+    tables = {
+        'ledger': models.AvailabilityLedger._meta.db_table,
+        'device_membership': models.ReservationDeviceMembership._meta.db_table,
+        'instance_membership': models.ReservationInstanceMembership._meta.db_table,
+        'checkout': models.ReservationCheckoutInstance._meta.db_table,
+        'reservation': models.Reservation._meta.db_table,
+        'instance': models.Instance._meta.db_table,
+    }
+    tables['bookings'] = BOOKINGS_SQL.format(**tables)
+    tables['expected'] = EXPECTED_SQL.format(**tables)
+    return template.format(**tables)
+
+
+def book(device_id, start, end, amount):
+    if amount == 0 or start >= end:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(BOOK_SQL), [device_id, amount, start, end])
+
+
+def move_reservation(reservation, old_start, old_end):
+    amounts = {}
+    for device_id, amount in reservation.reservationdevicemembership_set.values_list('device') \
+            .annotate(Sum('amount')).order_by():
+        amounts[device_id] = amounts.get(device_id, 0) + amount
+    for device_id in reservation.instances.values_list('device', flat=True):
+        amounts[device_id] = amounts.get(device_id, 0) + 1
+    for device_id in reservation.checked_out_instances.values_list('device', flat=True):
+        amounts[device_id] = amounts.get(device_id, 0) + 1
+    for device_id, amount in amounts.items():
+        book(device_id, old_start, old_end, -amount)
+        book(device_id, reservation.start_date, reservation.end_date, amount)
+
+
+def move_instance(instance, old_device_id):
+    # the bookings of an instance stay with it when it is assigned to another device
+    periods = list(models.ReservationInstanceMembership.objects.filter(instance=instance)
+                   .values_list('reservation__start_date', 'reservation__end_date'))
+    periods += list(models.ReservationCheckoutInstance.objects.filter(instance=instance)
+                    .values_list('reservation__start_date', 'reservation__end_date'))
+    for start, end in periods:
+        book(old_device_id, start, end, -1)
+        book(instance.device_id, start, end, 1)
+
+
+def peak(device, start, end):
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    booked = models.AvailabilityLedger.objects.filter(device=device, bucket__gte=hour, bucket__lt=end)\
+        .aggregate(Max('booked'))['booked__max']
+    return booked or 0
+
+
+def rebuild():
+    with transaction.atomic():
+        # concurrent bookings wait for the rebuild, bookings not committed yet are waited for
+        with connection.cursor() as cursor:
+            cursor.execute('LOCK TABLE {} IN EXCLUSIVE MODE'.format(models.AvailabilityLedger._meta.db_table))
+        models.AvailabilityLedger.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(_sql(REBUILD_SQL))
+
+
+def verify():
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(VERIFY_SQL))
+        return cursor.fetchall()
@@ -0,0 +1,27 @@
+import time
+from django.db import connection
+from rms.exceptions import LockError
+
+# first key of the two-key form of postgres advisory locks, keeps device locks apart from other users
+DEVICE_LOCK_NAMESPACE = 1
+# taken by the booking triggers of the instance tables, see migration 0020
+INSTANCE_LOCK_NAMESPACE = 2
+LOCK_ATTEMPTS = 8
+LOCK_RETRY_DELAY = 0.01
+
+
+def lock_devices(device_ids):
+    # has to run inside a transaction, the locks are released on commit or rollback
+    # devices are always locked in the same order so two bookings can not deadlock
+    with connection.cursor() as cursor:
+        for device_id in sorted(set(device_ids)):
+            delay = LOCK_RETRY_DELAY
+            for attempt in range(LOCK_ATTEMPTS):
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [DEVICE_LOCK_NAMESPACE, device_id])
+                if cursor.fetchone()[0]:
+                    break
+                time.sleep(delay)
+                delay *= 2
+            else:
+                raise LockError('Das Gerät wird gerade von einer anderen Buchung verwendet. '
+                                'Bitte versuche es erneut.')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import localtime
+from rms import ledger
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the availability ledger from all reservations and verifies it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true', help='Only compare the ledger with the reservations.')
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            ledger.rebuild()
+            self.stdout.write('Ledger rebuilt.')
+        mismatches = ledger.verify()
+        for device_id, bucket, booked, expected in mismatches:
+            self.stderr.write('Device {} at {}: {} booked in ledger, {} expected'
+                              .format(device_id, localtime(bucket).isoformat(), booked, expected))
+        if len(mismatches) > 0:
+            raise CommandError('Ledger differs from reservations in {} buckets.'.format(len(mismatches)))
+        self.stdout.write(self.style.SUCCESS('Ledger verified.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from rms import models, navigation
+
+
+class Command(BaseCommand):
+    help = 'Moves the status of reservations along with time. Run it periodically, e.g. every minute by cron.'
+
+    def handle(self, *args, **options):
+        updated = models.Reservation.objects.tick()
+        if updated > 0:
+            navigation.invalidate_reservations()
+        self.stdout.write('{} reservations updated.'.format(updated))
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0012_auto_20180906_1439'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='instance',
+            name='rentable',
+            field=models.BooleanField(default=True, verbose_name='Ausleihbar'),
+        ),
+        migrations.AlterField(
+            model_name='instance',
+            name='warehouse',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.PROTECT, to='rms.Warehouse', verbose_name='Lagerort'),
+        ),
+        migrations.AlterField(
+            model_name='warehouse',
+            name='name',
+            field=models.CharField(max_length=200, verbose_name='Bezeichnung'),
+        ),
+        migrations.CreateModel(
+            name='AvailabilityLedger',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('booked', models.IntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rms.Device')),
+            ],
+            options={
+                'unique_together': {('device', 'bucket')},
+            },
+        ),
+    ]
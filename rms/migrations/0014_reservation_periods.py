@@ -0,0 +1,127 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:07
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+PERIOD_TRIGGERS = '''
+CREATE FUNCTION rms_reservation_period() RETURNS trigger AS $$
+BEGIN
+    NEW.period := tstzrange(NEW.start_date, NEW.end_date, '[)');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rms_reservation_period BEFORE INSERT OR UPDATE ON rms_reservation
+    FOR EACH ROW EXECUTE PROCEDURE rms_reservation_period();
+
+CREATE FUNCTION rms_reservation_relation_period() RETURNS trigger AS $$
+BEGIN
+    SELECT period INTO NEW.period FROM rms_reservation WHERE id = NEW.reservation_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rms_reservationinstancemembership_period BEFORE INSERT OR UPDATE ON rms_reservationinstancemembership
+    FOR EACH ROW EXECUTE PROCEDURE rms_reservation_relation_period();
+
+CREATE TRIGGER rms_reservationcheckoutinstance_period BEFORE INSERT OR UPDATE ON rms_reservationcheckoutinstance
+    FOR EACH ROW EXECUTE PROCEDURE rms_reservation_relation_period();
+
+CREATE FUNCTION rms_reservation_period_changed() RETURNS trigger AS $$
+BEGIN
+    IF NEW.period IS DISTINCT FROM OLD.period THEN
+        UPDATE rms_reservationinstancemembership SET period = NEW.period WHERE reservation_id = NEW.id;
+        UPDATE rms_reservationcheckoutinstance SET period = NEW.period WHERE reservation_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rms_reservation_period_changed AFTER UPDATE ON rms_reservation
+    FOR EACH ROW EXECUTE PROCEDURE rms_reservation_period_changed();
+
+UPDATE rms_reservation SET period = tstzrange(start_date, end_date, '[)');
+UPDATE rms_reservationinstancemembership membership SET period = reservation.period
+    FROM rms_reservation reservation WHERE reservation.id = membership.reservation_id;
+UPDATE rms_reservationcheckoutinstance checkout SET period = reservation.period
+    FROM rms_reservation reservation WHERE reservation.id = checkout.reservation_id;
+'''
+
+DROP_PERIOD_TRIGGERS = '''
+DROP TRIGGER rms_reservation_period_changed ON rms_reservation;
+DROP FUNCTION rms_reservation_period_changed();
+DROP TRIGGER rms_reservationcheckoutinstance_period ON rms_reservationcheckoutinstance;
+DROP TRIGGER rms_reservationinstancemembership_period ON rms_reservationinstancemembership;
+DROP FUNCTION rms_reservation_relation_period();
+DROP TRIGGER rms_reservation_period ON rms_reservation;
+DROP FUNCTION rms_reservation_period();
+'''
+
+OVERLAPS = '''
+SELECT a.instance_id, a.reservation_id, b.reservation_id FROM {table} a
+    JOIN {table} b ON a.instance_id = b.instance_id AND a.id < b.id AND a.period && b.period
+    ORDER BY a.instance_id, a.reservation_id, b.reservation_id
+'''
+
+
+def check_overlaps(apps, schema_editor):
+    # the old availability check missed some overlaps, the constraints can only be added once they are resolved
+    overlaps = []
+    with schema_editor.connection.cursor() as cursor:
+        for table, kind in [('rms_reservationinstancemembership', 'reserved'),
+                            ('rms_reservationcheckoutinstance', 'checked out')]:
+            cursor.execute(OVERLAPS.format(table=table))
+            overlaps += ['instance {} {} by reservations {} and {}'.format(instance_id, kind, first, second)
+                         for instance_id, first, second in cursor.fetchall()]
+    if len(overlaps) > 0:
+        raise RuntimeError('Overlapping reservations have to be resolved before migrating, remove the instance from '
+                           'one of the reservations or check it in:\n'+'\n'.join(overlaps))
+
+
+EXCLUSION_CONSTRAINTS = '''
+ALTER TABLE rms_reservationinstancemembership ADD CONSTRAINT rms_reservationinstancemembership_no_overlap
+    EXCLUDE USING gist (instance_id WITH =, period WITH &&);
+ALTER TABLE rms_reservationcheckoutinstance ADD CONSTRAINT rms_reservationcheckoutinstance_no_overlap
+    EXCLUDE USING gist (instance_id WITH =, period WITH &&);
+'''
+
+DROP_EXCLUSION_CONSTRAINTS = '''
+ALTER TABLE rms_reservationcheckoutinstance DROP CONSTRAINT rms_reservationcheckoutinstance_no_overlap;
+ALTER TABLE rms_reservationinstancemembership DROP CONSTRAINT rms_reservationinstancemembership_no_overlap;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0013_availabilityledger'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.AddField(
+            model_name='reservation',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservationcheckoutinstance',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='reservationinstancemembership',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['period'], name='rms_reservation_period_gist'),
+        ),
+        migrations.RunSQL(PERIOD_TRIGGERS, DROP_PERIOD_TRIGGERS),
+        migrations.RunPython(check_overlaps, migrations.RunPython.noop),
+        migrations.RunSQL(EXCLUSION_CONSTRAINTS, DROP_EXCLUSION_CONSTRAINTS),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0014_reservation_periods'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=100, unique=True)),
+                ('action', models.CharField(choices=[('checkout', 'Ausleihe'), ('checkin', 'Rückgabe')], max_length=10)),
+                ('inventory_number', models.CharField(max_length=200)),
+                ('scanned_at', models.DateTimeField()),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(null=True)),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rms.Reservation')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# icontains compiles to UPPER(column::text) LIKE UPPER(pattern), the indexes cover exactly that expression
+SEARCH_COLUMNS = {
+    'rms_device': ['name', 'vendor', 'model_number', 'description'],
+    'rms_instance': ['inventory_number', 'serial_number', 'identificial_description'],
+    'rms_tag': ['name'],
+    'rms_reservation': ['name', 'description'],
+    'rms_customer': ['company', 'first_name', 'last_name', 'mail', 'phone', 'mobile'],
+    'rms_address': ['city', 'street', 'zip_code', 'mailbox'],
+}
+
+CREATE_INDEXES = ['CREATE INDEX {table}_{column}_trgm ON {table} USING gin (UPPER({column}::text) gin_trgm_ops);'
+                  .format(table=table, column=column)
+                  for table, columns in SEARCH_COLUMNS.items() for column in columns]
+
+DROP_INDEXES = ['DROP INDEX {table}_{column}_trgm;'.format(table=table, column=column)
+                for table, columns in SEARCH_COLUMNS.items() for column in columns]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0015_scanevent'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
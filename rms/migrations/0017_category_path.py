@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    Category = apps.get_model('rms', 'Category')
+    level = [(category_id, '') for category_id in
+             Category.objects.filter(top_category=None).values_list('id', flat=True)]
+    while len(level) > 0:
+        next_level = []
+        for category_id, parent_path in level:
+            path = parent_path+str(category_id)+'/'
+            Category.objects.filter(id=category_id).update(path=path)
+            next_level.extend((child_id, path) for child_id in
+                              Category.objects.filter(top_category=category_id).values_list('id', flat=True))
+        level = next_level
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0016_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+FILL_STATUS = '''
+    UPDATE rms_reservation SET status = CASE
+        WHEN id IN (SELECT reservation_id FROM rms_reservationcheckoutinstance) AND end_date < now() THEN 'overdue'
+        WHEN id IN (SELECT reservation_id FROM rms_reservationcheckoutinstance)
+            OR (start_date <= now() AND end_date >= now()) THEN 'active'
+        WHEN end_date < now() THEN 'closed'
+        ELSE 'planned'
+    END;
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0018_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='status',
+            field=models.CharField(choices=[('planned', 'Geplant'), ('active', 'Aktiv'), ('overdue', 'Überfällig'), ('closed', 'Abgeschlossen')], default='planned', editable=False, max_length=10, verbose_name='Status'),
+        ),
+        migrations.RunSQL(FILL_STATUS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(status='planned'), fields=['start_date', 'id'], name='rms_reservation_planned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(status='active'), fields=['end_date'], name='rms_reservation_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(status='overdue'), fields=['start_date', 'id'], name='rms_reservation_overdue_idx'),
+        ),
+    ]
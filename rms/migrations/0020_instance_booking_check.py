@@ -0,0 +1,71 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:05
+
+from django.db import migrations
+
+
+# The exclusion constraints of 0014 only compare rows of the same table. An instance reserved by one reservation
+# and checked out by another one overlapping it is rejected by these triggers. The instance lock makes concurrent
+# bookings of the same instance check one after the other, its namespace is rms.locking.INSTANCE_LOCK_NAMESPACE.
+BOOKING_TRIGGERS = '''
+CREATE FUNCTION rms_instance_booking_check() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(2, NEW.instance_id);
+    IF TG_TABLE_NAME = 'rms_reservationinstancemembership' THEN
+        PERFORM 1 FROM rms_reservationcheckoutinstance
+            WHERE instance_id = NEW.instance_id AND reservation_id <> NEW.reservation_id AND period && NEW.period;
+    ELSE
+        PERFORM 1 FROM rms_reservationinstancemembership
+            WHERE instance_id = NEW.instance_id AND reservation_id <> NEW.reservation_id AND period && NEW.period;
+    END IF;
+    IF FOUND THEN
+        RAISE EXCEPTION 'instance % is booked by an overlapping reservation', NEW.instance_id
+            USING ERRCODE = 'exclusion_violation';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER rms_reservationinstancemembership_booking_check
+    AFTER INSERT OR UPDATE OF instance_id, period ON rms_reservationinstancemembership
+    FOR EACH ROW EXECUTE PROCEDURE rms_instance_booking_check();
+
+CREATE TRIGGER rms_reservationcheckoutinstance_booking_check
+    AFTER INSERT OR UPDATE OF instance_id, period ON rms_reservationcheckoutinstance
+    FOR EACH ROW EXECUTE PROCEDURE rms_instance_booking_check();
+'''
+
+DROP_BOOKING_TRIGGERS = '''
+DROP TRIGGER rms_reservationcheckoutinstance_booking_check ON rms_reservationcheckoutinstance;
+DROP TRIGGER rms_reservationinstancemembership_booking_check ON rms_reservationinstancemembership;
+DROP FUNCTION rms_instance_booking_check();
+'''
+
+OVERLAPS = '''
+SELECT membership.instance_id, membership.reservation_id, checkout.reservation_id
+    FROM rms_reservationinstancemembership membership JOIN rms_reservationcheckoutinstance checkout
+    ON membership.instance_id = checkout.instance_id AND membership.reservation_id <> checkout.reservation_id
+    AND membership.period && checkout.period
+    ORDER BY membership.instance_id, membership.reservation_id, checkout.reservation_id
+'''
+
+
+def check_overlaps(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(OVERLAPS)
+        overlaps = ['instance {} reserved by reservation {} and checked out by reservation {}'.format(*row)
+                    for row in cursor.fetchall()]
+    if len(overlaps) > 0:
+        raise RuntimeError('Overlapping reservations have to be resolved before migrating, remove the instance from '
+                           'the reservation or check it in:\n'+'\n'.join(overlaps))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0019_reservation_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_overlaps, migrations.RunPython.noop),
+        migrations.RunSQL(BOOKING_TRIGGERS, DROP_BOOKING_TRIGGERS),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:20
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # the database cache is the default, installations that only run migrate get its table here as well
+    call_command('createcachetable', database=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rms', '0020_instance_booking_check'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import models, transaction, connection, IntegrityError
 from django.contrib.auth import models as auth_models
+from django.core.exceptions import EmptyResultSet
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GistIndex
 from djmoney.models.fields import MoneyField
 import string
 import random
 import os
 from rmsv2.settings import BASE_DIR, COMPANY_SHORT, SUB_PATH
 from django.db.models import Q
+from django.db.models.functions import Coalesce, Concat, Substr
 from rms.exceptions import *
 from django.utils import timezone
 
@@ -47,14 +52,72 @@ class Category(models.Model):
     class Meta:
         permissions = (('view_category', 'Can view category'),)
 
+    PATH_SEPARATOR = '/'
+
     name = models.CharField('Name', max_length=200)
     top_category = models.ForeignKey('Category', on_delete=models.PROTECT, null=True, blank=True, verbose_name='Übergeordnete Kategorie')
+    # ids from the top category down to this one, e.g. "3/17/42/"
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
 
     def __str__(self):
         return self.name
 
-    def sub_categories_sorted_by_name(self):
-        return Category.objects.filter(top_category=self).order_by('name')
+    def save(self, *args, **kwargs):
+        parent_path = ''
+        if self.top_category_id is not None:
+            parent_path = Category.objects.filter(id=self.top_category_id).values_list('path', flat=True).get()
+        old_path = None
+        if self.id is not None:
+            old_path = Category.objects.filter(id=self.id).values_list('path', flat=True).first()
+            self.path = parent_path+str(self.id)+self.PATH_SEPARATOR
+        super(Category, self).save(*args, **kwargs)
+        if old_path is None:
+            # the path of a new category contains its id
+            self.path = parent_path+str(self.id)+self.PATH_SEPARATOR
+            Category.objects.filter(id=self.id).update(path=self.path)
+        elif old_path not in ('', self.path):
+            # the sub categories move along with this one
+            Category.objects.filter(path__startswith=old_path).exclude(id=self.id) \
+                .update(path=Concat(models.Value(self.path), Substr('path', len(old_path)+1)))
+
+    @classmethod
+    def tree(cls):
+        categories = list(cls.objects.order_by('name'))
+        children = {}
+        for category in categories:
+            children.setdefault(category.top_category_id, []).append(category)
+        for category in categories:
+            category.children = children.get(category.id, [])
+        return children.get(None, [])
+
+    def ancestor_ids(self):
+        return [int(category_id) for category_id in self.path.split(self.PATH_SEPARATOR) if category_id != '']
+
+    def ancestors(self):
+        # the category itself included, from the top category down
+        categories = Category.objects.in_bulk(self.ancestor_ids())
+        return [categories[category_id] for category_id in self.ancestor_ids() if category_id in categories]
+
+    def subtree(self):
+        return Category.objects.filter(path__startswith=self.path)
+
+    def subtree_ids(self):
+        return list(self.subtree().values_list('id', flat=True))
+
+
+class DeviceQuerySet(models.QuerySet):
+
+    def with_list_data(self):
+        # everything the device list shows, aggregated over the instances in the same query
+        # the list only shows warehouse names, warehouses sharing a name are listed once
+        # the delete dialogs of the list show the tags
+        return self.annotate(
+            instance_total=models.Count('instance', distinct=True),
+            rentable_total=models.Count('instance', distinct=True,
+                                        filter=Q(instance__rentable=True, instance__broken=False)),
+            warehouse_names=ArrayAgg('instance__warehouse__name', distinct=True,
+                                     filter=Q(instance__warehouse__isnull=False)),
+        ).prefetch_related('tags')
 
 
 class Device(models.Model):
@@ -62,6 +125,8 @@ class Device(models.Model):
     class Meta:
         permissions = (('view_device', 'Can view device'),)
 
+    objects = DeviceQuerySet.as_manager()
+
     name = models.CharField('Name', max_length=100)
     picture = models.ImageField('Bild', upload_to=get_device_image_upload_path, blank=True, null=True, default=None)
     model_number = models.CharField('Modell Nummer', max_length=100)
@@ -80,59 +145,35 @@ class Device(models.Model):
     def __str__(self):
         return '{} ({})'.format(self.name, self.vendor)
 
-    @property
-    def instances_count(self):
-        return self.instance_set.count()
-
-    @property
-    def rentable_instances_count(self):
-        return self.instance_set.filter(rentable=True, broken=False).count()
-
     @property
     def picture_url(self):
         return SUB_PATH+'/'+str(self.picture)
 
     def available_count(self, start, end):
-        available = 0
-        collisions = set()
-        for instance in self.instance_set.all():
-            is_available, instance_collisions = instance.is_available(start, end)
-            if is_available:
-                available += 1
-            else:
-                collisions = collisions.union(instance_collisions)
-        colliding_reservations = self.reservationdevicemembership_set.filter(
-            (Q(reservation__start_date__gte=start) & Q(reservation__end_date__lt=end)) |
-            (Q(reservation__end_date__gt=start) & Q(reservation__end_date__lte=end)) |
-            (Q(reservation__start_date__lte=start) & Q(reservation__end_date__gte=end))
-        )
-        colliding_reservations_count = colliding_reservations.aggregate(models.Sum('amount'))['amount__sum']
-        for reservation_relation in colliding_reservations:
-            collisions.add(reservation_relation.reservation)
-        if colliding_reservations_count is not None:
-            available -= colliding_reservations_count
-        return available, collisions
+        from rms.availability import device_availability
+        return device_availability(self, start, end)
 
     def add_to_reservation(self, reservation, amount):
-        available, collisions = self.available_count(reservation.start_date, reservation.end_date)
-        if available < amount:
-            raise ReservationError('Es sind nicht genug Geräte zur ausgewählten Zeit verfügbar.', collisions)
-        try:
-            reservationdevice_membership = reservation.reservationdevicemembership_set.get(device=self)
-            reservationdevice_membership.amount += amount
-            reservationdevice_membership.save()
-        except ReservationDeviceMembership.DoesNotExist:
-            ReservationDeviceMembership.objects.create(reservation=reservation, device=self, amount=amount)
+        from rms.availability import has_free_units, alternatives
+        from rms.locking import lock_devices
+        with transaction.atomic():
+            lock_devices([self.id])
+            is_available, collisions = has_free_units(self, reservation.start_date, reservation.end_date, amount)
+            if is_available:
+                try:
+                    reservationdevice_membership = reservation.reservationdevicemembership_set.get(device=self)
+                    reservationdevice_membership.amount += amount
+                    reservationdevice_membership.save()
+                except ReservationDeviceMembership.DoesNotExist:
+                    ReservationDeviceMembership.objects.create(reservation=reservation, device=self, amount=amount)
+                return
+        # the substitutes are searched after the lock has been released
+        raise ReservationError('Es sind nicht genug Geräte zur ausgewählten Zeit verfügbar.', collisions,
+                               alternatives(self, reservation.start_date, reservation.end_date, amount))
 
     def instances_to_checkout(self, reservation):
-        reservation_relation = self.reservationdevicemembership_set.objects.get(reservation=reservation)
-        instances = []
-        for instance in self.instance_set.all():
-            is_available, collisions = instance.is_available(reservation_relation.reservation.start_date,
-                                                             reservation_relation.reservation.end_date)
-            if is_available:
-                instances.append(instance)
-        return instances
+        from rms.availability import free_instances
+        return list(free_instances(reservation, self.instance_set.order_by('inventory_number')))
 
 
 class Instance(models.Model):
@@ -154,21 +195,16 @@ class Instance(models.Model):
     def is_available(self, start, end, indirect=False):
         if not self.rentable:
             return False, set()
-        colliding_reservations = self.reservation_set.filter(
-            (Q(start_date__gte=start) & Q(end_date__lt=end)) |
-            (Q(end_date__gt=start) & Q(end_date__lte=end)) |
-            (Q(start_date__lte=start) & Q(end_date__gte=end))
-        )
-        colliding_checkouts = self.reservationcheckoutinstance_set.filter(
-            (Q(reservation__start_date__gte=start) & Q(reservation__end_date__lt=end)) |
-            (Q(reservation__end_date__gt=start) & Q(reservation__end_date__lte=end)) |
-            (Q(reservation__start_date__lte=start) & Q(reservation__end_date__gte=end))
-        )
-        checkout_collisions = set()
-        for reservation_relation in colliding_checkouts:
-            checkout_collisions.add(reservation_relation.reservation)
-        if colliding_reservations.count()+colliding_checkouts.count() > 0:
-            return False, set(colliding_reservations).union(checkout_collisions)
+        from rms.availability import overlapping
+        collisions = set()
+        for reservation_relation in self.reservationinstancemembership_set.filter(overlapping(start, end))\
+                .select_related('reservation'):
+            collisions.add(reservation_relation.reservation)
+        for reservation_relation in self.reservationcheckoutinstance_set.filter(overlapping(start, end))\
+                .select_related('reservation'):
+            collisions.add(reservation_relation.reservation)
+        if len(collisions) > 0:
+            return False, collisions
         if indirect:
             device_available_count, device_collisions = self.device.available_count(start, end)
             if device_available_count == 0:
@@ -176,11 +212,18 @@ class Instance(models.Model):
         return True, set()
 
     def add_to_reservation(self, reservation):
-        is_available, collisions = self.is_available(reservation.start_date, reservation.end_date, indirect=True)
-        if is_available:
-            ReservationInstanceMembership.objects.create(reservation=reservation, instance=self)
-        else:
-            raise ReservationError('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.', collisions)
+        from rms.locking import lock_devices
+        try:
+            with transaction.atomic():
+                lock_devices([self.device_id])
+                is_available, collisions = self.is_available(reservation.start_date, reservation.end_date,
+                                                             indirect=True)
+                if not is_available:
+                    raise ReservationError('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.', collisions)
+                ReservationInstanceMembership.objects.create(reservation=reservation, instance=self)
+        except IntegrityError:
+            raise ReservationError('Dieses Gerät ist zur ausgewählten Zeit nicht verfügbar.',
+                                   self.is_available(reservation.start_date, reservation.end_date)[1])
 
 
 class Address(models.Model):
@@ -204,6 +247,7 @@ class Customer(models.Model):
 
     class Meta:
         permissions = (('view_customer', 'Can view customer'),)
+        indexes = [models.Index(fields=['last_name', 'first_name', 'id'], name='rms_customer_name_idx')]
 
     company = models.CharField('Firma', max_length=200, default=None, null=True)
     title = models.CharField('Titel', max_length=50, default=None, null=True)
@@ -228,17 +272,100 @@ class Project(models.Model):
     pass
 
 
+def _reservation_total(model, aggregate):
+    return Coalesce(models.Subquery(model.objects.filter(reservation=models.OuterRef('pk')).order_by()
+                                    .values('reservation').annotate(total=aggregate).values('total'),
+                                    output_field=models.IntegerField()), models.Value(0))
+
+
+def _delete_without_signals(queryset):
+    # one statement for the whole batch, the callers update the ledger and the navigation themselves
+    try:
+        sql, params = queryset.values('id').query.sql_with_params()
+    except EmptyResultSet:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(queryset.model._meta.db_table, sql), params)
+
+
+class ReservationQuerySet(models.QuerySet):
+
+    def with_counts(self):
+        # one correlated subquery per related table instead of joining them all into each other
+        return self.annotate(
+            device_total=_reservation_total(ReservationInstanceMembership, models.Count('id')) +
+            _reservation_total(ReservationDeviceMembership, models.Sum('amount')),
+            checked_out_total=_reservation_total(ReservationCheckoutInstance, models.Count('id')) +
+            _reservation_total(AbstractItem, models.Sum('amount')),
+            checked_in_total=_reservation_total(ReservationClearedInstance, models.Count('id')),
+        )
+
+    def with_header_data(self):
+        # everything the header of the reservation pages shows, including whether there are checkouts without a ticket
+        def checked_out_since_ticket(model):
+            return models.Exists(model.objects.filter(reservation=models.OuterRef('pk'),
+                                                      checkout_date__gte=models.OuterRef('latest_ticket_date')))
+        return self.with_counts().annotate(
+            latest_ticket_date=models.Subquery(CheckoutTicket.objects.filter(reservation=models.OuterRef('pk'))
+                                               .order_by('-creation_date').values('creation_date')[:1]),
+        ).annotate(
+            new_checkouts=checked_out_since_ticket(ReservationCheckoutInstance),
+            new_abstract_items=checked_out_since_ticket(AbstractItem),
+        ).annotate(needs_ticket=models.Case(
+            models.When(latest_ticket_date__isnull=True, then=models.Value(True)),
+            models.When(Q(new_checkouts=True) | Q(new_abstract_items=True), then=models.Value(True)),
+            default=models.Value(False), output_field=models.BooleanField()))
+
+    def refresh_status(self, now=None):
+        if now is None:
+            now = timezone.now()
+        checked_out = ReservationCheckoutInstance.objects.values('reservation')
+        return self.update(status=models.Case(
+            models.When(Q(id__in=checked_out, end_date__lt=now), then=models.Value(Reservation.OVERDUE)),
+            models.When(Q(id__in=checked_out) | Q(start_date__lte=now, end_date__gte=now),
+                        then=models.Value(Reservation.ACTIVE)),
+            models.When(end_date__lt=now, then=models.Value(Reservation.CLOSED)),
+            default=models.Value(Reservation.PLANNED), output_field=models.CharField()))
+
+    def tick(self, now=None):
+        # only time changes the status of these, everything else refreshes the status when it happens
+        if now is None:
+            now = timezone.now()
+        return self.filter(Q(status=Reservation.PLANNED, start_date__lte=now) |
+                           Q(status=Reservation.ACTIVE, end_date__lt=now)).refresh_status(now)
+
+
 class Reservation(models.Model):
+    PLANNED = 'planned'
+    ACTIVE = 'active'
+    OVERDUE = 'overdue'
+    CLOSED = 'closed'
+    STATUSES = ((PLANNED, 'Geplant'), (ACTIVE, 'Aktiv'), (OVERDUE, 'Überfällig'), (CLOSED, 'Abgeschlossen'))
 
     class Meta:
         permissions = (('view_reservation', 'Can view reservation'),)
+        indexes = [GistIndex(fields=['period'], name='rms_reservation_period_gist'),
+                   models.Index(fields=['start_date', 'id'], name='rms_reservation_start_idx'),
+                   # closed reservations are the bulk of the table and are listed through rms_reservation_start_idx
+                   models.Index(fields=['start_date', 'id'], name='rms_reservation_planned_idx',
+                                condition=Q(status='planned')),
+                   models.Index(fields=['end_date'], name='rms_reservation_active_idx',
+                                condition=Q(status='active')),
+                   models.Index(fields=['start_date', 'id'], name='rms_reservation_overdue_idx',
+                                condition=Q(status='overdue'))]
+
+    objects = ReservationQuerySet.as_manager()
 
     name = models.CharField('Name', max_length=250)
     owners = models.ManyToManyField(auth_models.User, verbose_name='Besitzer')
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, verbose_name='Kunde')
     start_date = models.DateTimeField('Start')
     end_date = models.DateTimeField('Ende')
+    # maintained by database triggers from start_date and end_date
+    period = DateTimeRangeField(null=True, editable=False)
     description = models.TextField('Beschreibung')
+    # maintained by refresh_status, the tick_reservations command moves it along with time
+    status = models.CharField('Status', max_length=10, choices=STATUSES, default=PLANNED, editable=False)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, default=None)
     devices = models.ManyToManyField(Device, through='ReservationDeviceMembership')
     instances = models.ManyToManyField(Instance, through='ReservationInstanceMembership')
@@ -251,13 +378,19 @@ class Reservation(models.Model):
     def full_id(self):
         return COMPANY_SHORT+'-'+str(self.id)
 
-    @property
-    def device_count(self):
-        count = 0
-        count += self.instances.count()
-        for device_relation in self.reservationdevicemembership_set.all():
-            count += device_relation.amount
-        return count
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.refresh_status()
+
+    def refresh_status(self):
+        Reservation.objects.filter(pk=self.pk).refresh_status()
+
+    def device_ids(self):
+        return set(Device.objects.filter(
+            Q(id__in=self.reservationdevicemembership_set.values('device')) |
+            Q(id__in=self.reservationinstancemembership_set.values('instance__device')) |
+            Q(id__in=self.reservationcheckoutinstance_set.values('instance__device'))
+        ).values_list('id', flat=True))
 
     def has_started(self):
         return timezone.now() > self.start_date
@@ -265,30 +398,179 @@ class Reservation(models.Model):
     def has_ended(self):
         return timezone.now() > self.end_date
 
+    def add_lines(self, lines):
+        from rms.availability import cart_errors
+        from rms.locking import lock_devices
+        from rms import ledger
+        devices = Device.objects.filter(active=True)\
+            .in_bulk([line['device'] for line in lines if 'device' in line])
+        instances = Instance.objects.in_bulk([line['instance'] for line in lines if 'instance' in line])
+        try:
+            with transaction.atomic():
+                lock_devices(list(devices)+[instance.device_id for instance in instances.values()])
+                errors = cart_errors(self, lines, devices, instances)
+                if any(error is not None for error in errors):
+                    raise CartError('Nicht alle Geräte konnten reserviert werden.', errors)
+
+                added = {}
+                device_amounts = {}
+                for line in lines:
+                    if 'device' in line:
+                        device_amounts[line['device']] = device_amounts.get(line['device'], 0)+line['amount']
+                        added[line['device']] = added.get(line['device'], 0)+line['amount']
+                    else:
+                        device_id = instances[line['instance']].device_id
+                        added[device_id] = added.get(device_id, 0)+1
+                existing = list(self.reservationdevicemembership_set.filter(device__in=device_amounts)
+                                .values_list('device', flat=True))
+                for device_id in existing:
+                    self.reservationdevicemembership_set.filter(device=device_id)\
+                        .update(amount=models.F('amount')+device_amounts.pop(device_id))
+                ReservationDeviceMembership.objects.bulk_create([
+                    ReservationDeviceMembership(reservation=self, device_id=device_id, amount=amount)
+                    for device_id, amount in device_amounts.items()
+                ])
+                ReservationInstanceMembership.objects.bulk_create([
+                    ReservationInstanceMembership(reservation=self, instance_id=line['instance'])
+                    for line in lines if 'instance' in line
+                ])
+                # bulk operations do not send signals
+                if ledger.enabled():
+                    for device_id, amount in added.items():
+                        ledger.book(device_id, self.start_date, self.end_date, amount)
+        except IntegrityError:
+            raise ReservationError('Die Geräte sind zur ausgewählten Zeit nicht verfügbar.', set())
+
     def checkout_instance(self, instance):
-        is_available, collisions = instance.is_available(self.start_date, self.end_date)
-        if is_available or self in collisions:
-            try:
-                instance_relation = self.reservationinstancemembership_set.get(instance=instance)
-                instance_relation.delete()
-            except ReservationInstanceMembership.DoesNotExist:
+        from rms.locking import lock_devices
+        try:
+            with transaction.atomic():
+                lock_devices([instance.device_id])
+                if self.reservationcheckoutinstance_set.filter(instance=instance).exists():
+                    raise CheckoutError('Das ausgewählte Gerät ist bereits für diese Reservierung ausgeliehen.',
+                                        set())
+                is_available, collisions = instance.is_available(self.start_date, self.end_date)
+                if not is_available and self not in collisions:
+                    raise CheckoutError('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar.',
+                                        collisions)
                 try:
-                    device_relation = self.reservationdevicemembership_set.get(device=instance.device)
-                    if device_relation.amount > 1:
-                        device_relation.amount -= 1
+                    instance_relation = self.reservationinstancemembership_set.get(instance=instance)
+                    instance_relation.delete()
+                except ReservationInstanceMembership.DoesNotExist:
+                    try:
+                        device_relation = self.reservationdevicemembership_set.get(device=instance.device)
+                        if device_relation.amount > 1:
+                            device_relation.amount -= 1
+                            device_relation.save()
+                        else:
+                            device_relation.delete()
+                    except ReservationDeviceMembership.DoesNotExist:
+                        is_available, collisions = instance.is_available(self.start_date, self.end_date,
+                                                                         indirect=True)
+                        if not is_available:
+                            raise CheckoutError('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt '
+                                                'nicht verfügbar', collisions)
+                ReservationCheckoutInstance.objects.create(reservation=self,
+                                                           instance=instance,
+                                                           checkout_date=timezone.now())
+                self.refresh_status()
+        except IntegrityError:
+            raise CheckoutError('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar.',
+                                instance.is_available(self.start_date, self.end_date)[1])
+
+    def checkout_instances(self, inventory_numbers):
+        from rms.availability import free_units, reservations_by_id
+        from rms.locking import lock_devices
+        from rms import ledger, navigation
+        instances = Instance.objects.filter(inventory_number__in=inventory_numbers)
+        instances = {instance.inventory_number: instance for instance in instances}
+        device_ids = set(instance.device_id for instance in instances.values())
+        try:
+            with transaction.atomic():
+                lock_devices(device_ids)
+                free, peak_reservations, booked_instances = free_units(device_ids, self.start_date, self.end_date)
+                checked_out = set(self.reservationcheckoutinstance_set.filter(instance__in=instances.values())
+                                  .values_list('instance', flat=True))
+                reserved = set(self.reservationinstancemembership_set.filter(instance__in=instances.values())
+                               .values_list('instance', flat=True))
+                remaining = dict(self.reservationdevicemembership_set.filter(device__in=device_ids)
+                                 .values_list('device', 'amount'))
+
+                # every scan is checked against the snapshot reduced by the scans accepted before it
+                errors = []
+                released_instances = []
+                released_devices = set()
+                added = {}
+                for inventory_number in inventory_numbers:
+                    instance = instances.get(inventory_number)
+                    error = None
+                    if instance is None:
+                        error = ('Es wurde kein Gerät mit der Inventarnummer "{}" gefunden'.format(inventory_number),
+                                 set())
+                    elif not instance.active:
+                        error = ('Das gewünschte Gerät ist im System deaktiviert und kann nicht entliehen werden.',
+                                 set())
+                    elif instance.id in checked_out:
+                        error = ('Das ausgewählte Gerät ist bereits für diese Reservierung ausgeliehen.', set())
+                    elif not instance.rentable or len(booked_instances[instance.id]-{self.id}) > 0:
+                        error = ('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar.',
+                                 booked_instances[instance.id]-{self.id})
+                    elif instance.id in reserved:
+                        released_instances.append(instance)
+                    elif remaining.get(instance.device_id, 0) > 0:
+                        remaining[instance.device_id] -= 1
+                        released_devices.add(instance.device_id)
+                    elif free[instance.device_id] > 0:
+                        free[instance.device_id] -= 1
+                    else:
+                        error = ('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar.',
+                                 peak_reservations[instance.device_id])
+                    if error is None:
+                        checked_out.add(instance.id)
+                        added[instance.device_id] = added.get(instance.device_id, 0)+1
+                    errors.append(error)
+
+                _delete_without_signals(self.reservationinstancemembership_set.filter(instance__in=released_instances))
+                for device_relation in self.reservationdevicemembership_set.filter(device__in=released_devices):
+                    if remaining[device_relation.device_id] > 0:
+                        device_relation.amount = remaining[device_relation.device_id]
                         device_relation.save()
                     else:
                         device_relation.delete()
-                except ReservationDeviceMembership.DoesNotExist:
-                    is_available, collisions = instance.is_available(self.start_date, self.end_date, indirect=True)
-                    if not is_available:
-                        raise CheckoutError('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar',
-                                            collisions)
-            ReservationCheckoutInstance.objects.create(reservation=self,
-                                                       instance=instance,
-                                                       checkout_date=timezone.now())
-        else:
-            raise CheckoutError('Das ausgewählte Gerät ist zum gewünschten Zeitpunkt nicht verfügbar.', collisions)
+                checkout_date = timezone.now()
+                ReservationCheckoutInstance.objects.bulk_create([
+                    ReservationCheckoutInstance(reservation=self, instance=instances[inventory_number],
+                                                checkout_date=checkout_date)
+                    for inventory_number, error in zip(inventory_numbers, errors) if error is None
+                ])
+                # bulk operations do not send signals, the released instance bookings turn into checkouts
+                if ledger.enabled():
+                    for instance in released_instances:
+                        added[instance.device_id] -= 1
+                    for device_id, amount in added.items():
+                        ledger.book(device_id, self.start_date, self.end_date, amount)
+                if len(added) > 0:
+                    self.refresh_status()
+                navigation.invalidate_reservations()
+        except IntegrityError:
+            raise CheckoutError('Die ausgewählten Geräte sind zum gewünschten Zeitpunkt nicht verfügbar.', set())
+
+        collisions = {reservation.id: reservation
+                      for reservation in reservations_by_id(set().union(*[error[1] for error in errors if error]))}
+        return [CheckoutError(error[0], set(collisions[reservation_id] for reservation_id in error[1]))
+                if error is not None else None for error in errors]
+
+    def instances_to_checkout(self):
+        from rms.availability import free_instances
+        instances = Instance.objects.filter(Q(device__in=self.reservationdevicemembership_set.values('device')) |
+                                            Q(id__in=self.reservationinstancemembership_set.values('instance')))
+        pick_list = {}
+        for instance in free_instances(self, instances).select_related('device', 'warehouse')\
+                .order_by('device__name', 'inventory_number'):
+            if instance.device not in pick_list:
+                pick_list[instance.device] = []
+            pick_list[instance.device].append(instance)
+        return pick_list
 
     def checkin_instance(self, instance):
         try:
@@ -298,24 +580,78 @@ class Reservation(models.Model):
                                                       checkout_date=checked_out_relation.checkout_date,
                                                       checkin_date=timezone.now())
             checked_out_relation.delete()
+            self.refresh_status()
         except ReservationCheckoutInstance.DoesNotExist:
             raise CheckinError('Das ausgewählte Gerät wurde nicht für diese Reservierung ausgeliehen.')
 
-    def non_ticket_instances(self):
-        latest_pdf = self.checkoutticket_set.order_by('-creation_date').first()
-        if latest_pdf is not None:
-            new_checkouts = self.reservationcheckoutinstance_set \
-                .filter(checkout_date__gte=latest_pdf.creation_date).count()
-            new_checkouts += self.abstract_items.filter(checkout_date__gte=latest_pdf.creation_date).count()
-            if new_checkouts == 0:
-                return False
-        return True
-
-    def checked_out_count(self):
-        count = self.checked_out_instances.count()
-        for item in self.abstract_items.all():
-            count += item.amount
-        return count
+    def checkin_instances(self, inventory_numbers, abstract_items=None):
+        from rms import ledger, navigation
+        with transaction.atomic():
+            # a concurrent check-in of the same instances waits here and no longer sees the rows cleared before
+            checked_out = {relation.instance.inventory_number: relation for relation in
+                           self.reservationcheckoutinstance_set.filter(instance__inventory_number__in=inventory_numbers)
+                           .select_related('instance').select_for_update(of=('self',))}
+            known = set(Instance.objects.filter(inventory_number__in=set(inventory_numbers)-set(checked_out))
+                        .values_list('inventory_number', flat=True)).union(checked_out)
+            errors = []
+            cleared = []
+            for inventory_number in inventory_numbers:
+                relation = checked_out.pop(inventory_number, None)
+                if inventory_number not in known:
+                    errors.append(CheckinError('Es wurde kein Gerät mit der Inventarnummer "{}" gefunden'
+                                               .format(inventory_number)))
+                elif relation is None:
+                    errors.append(CheckinError('Das ausgewählte Gerät wurde nicht für diese Reservierung '
+                                               'ausgeliehen.'))
+                else:
+                    cleared.append(relation)
+                    errors.append(None)
+            checkin_date = timezone.now()
+            ReservationClearedInstance.objects.bulk_create([
+                ReservationClearedInstance(reservation=self, instance=relation.instance,
+                                           checkout_date=relation.checkout_date, checkin_date=checkin_date)
+                for relation in cleared
+            ])
+            _delete_without_signals(ReservationCheckoutInstance.objects
+                                    .filter(id__in=[relation.id for relation in cleared]))
+            if len(cleared) > 0:
+                if ledger.enabled():
+                    released = {}
+                    for relation in cleared:
+                        released[relation.instance.device_id] = released.get(relation.instance.device_id, 0)+1
+                    for device_id, amount in released.items():
+                        ledger.book(device_id, self.start_date, self.end_date, -amount)
+                self.refresh_status()
+                navigation.invalidate_reservations()
+            leftovers = self.checkin_abstract_items(abstract_items or {})
+        return errors, leftovers
+
+    def checkin_abstract_items(self, amounts):
+        amounts = {name: amount for name, amount in amounts.items() if amount > 0}
+        with transaction.atomic():
+            # window functions can not be combined with FOR UPDATE, so the items are locked by a query of their own
+            list(self.abstract_items.filter(name__in=amounts).select_for_update().values_list('id'))
+            # the oldest items are returned first, every item sees the amount checked out before it
+            items = self.abstract_items.filter(name__in=amounts).annotate(
+                running_amount=models.Window(models.Sum('amount'), partition_by=[models.F('name')],
+                                             order_by=[models.F('checkout_date').asc(), models.F('id').asc()])
+            ).values_list('id', 'name', 'amount', 'running_amount')
+            cleared = []
+            reduced = {}
+            leftovers = dict(amounts)
+            for item_id, name, amount, running_amount in items:
+                returned = min(max(amounts[name]-(running_amount-amount), 0), amount)
+                if returned == amount:
+                    cleared.append(item_id)
+                elif returned > 0:
+                    reduced[item_id] = amount-returned
+                leftovers[name] -= returned
+            AbstractItem.objects.filter(id__in=cleared).delete()
+            if len(reduced) > 0:
+                AbstractItem.objects.filter(id__in=reduced).update(amount=models.Case(
+                    *[models.When(id=item_id, then=models.Value(amount)) for item_id, amount in reduced.items()],
+                    output_field=models.IntegerField()))
+        return {name: amount for name, amount in leftovers.items() if amount > 0}
 
     def __str__(self):
         return '{} {} ({} - {})'.format(self.full_id, self.name, str(self.start_date), str(self.end_date))
@@ -330,12 +666,18 @@ class ReservationDeviceMembership(models.Model):
 class ReservationInstanceMembership(models.Model):
     reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE)
     instance = models.ForeignKey(Instance, on_delete=models.PROTECT)
+    # copy of the reservation period maintained by database triggers, overlapping bookings of an instance are
+    # rejected by an exclusion constraint and, against the checkouts, by a trigger
+    period = DateTimeRangeField(null=True, editable=False)
 
 
 class ReservationCheckoutInstance(models.Model):
     reservation = models.ForeignKey(Reservation, on_delete=models.PROTECT)
     instance = models.ForeignKey(Instance, on_delete=models.PROTECT)
     checkout_date = models.DateTimeField()
+    # copy of the reservation period maintained by database triggers, overlapping bookings of an instance are
+    # rejected by an exclusion constraint and, against the reservations of instances, by a trigger
+    period = DateTimeRangeField(null=True, editable=False)
 
 
 class ReservationClearedInstance(models.Model):
@@ -368,6 +710,30 @@ class Warehouse(models.Model):
 
     class Meta:
         permissions = (('view_warehouse', 'Can view warehouse'),)
+        indexes = [models.Index(fields=['name', 'id'], name='rms_warehouse_name_idx')]
 
     def __str__(self):
         return self.name
+
+
+class AvailabilityLedger(models.Model):
+    device = models.ForeignKey(Device, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    booked = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('device', 'bucket'),)
+
+
+class ScanEvent(models.Model):
+    CHECKOUT = 'checkout'
+    CHECKIN = 'checkin'
+    ACTIONS = ((CHECKOUT, 'Ausleihe'), (CHECKIN, 'Rückgabe'))
+
+    client_id = models.CharField(max_length=100, unique=True)
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    inventory_number = models.CharField(max_length=200)
+    scanned_at = models.DateTimeField()
+    synced_at = models.DateTimeField(default=timezone.now)
+    error = models.TextField(null=True)
@@ -0,0 +1,34 @@
+from django.core.cache import cache
+from rms import models
+
+# The navigation around every page is cached in the cache shared by all processes. Changes invalidate it through
+# signals, the timeouts bound how long changes made by bulk updates, which send no signals, stay unnoticed.
+
+CATEGORY_TREE_KEY = 'rms:navigation:categories'
+CATEGORY_TREE_TIMEOUT = 300
+RESERVATIONS_VERSION_KEY = 'rms:navigation:reservations'
+OVERDUE_KEY = 'rms:navigation:overdue:{version}:{user}'
+OVERDUE_TIMEOUT = 60
+
+
+def category_tree():
+    return cache.get_or_set(CATEGORY_TREE_KEY, models.Category.tree, CATEGORY_TREE_TIMEOUT)
+
+
+def overdue_reservations_count(user):
+    version = cache.get_or_set(RESERVATIONS_VERSION_KEY, 1, None)
+
+    def count():
+        return models.Reservation.objects.filter(owners=user, status=models.Reservation.OVERDUE).count()
+    return cache.get_or_set(OVERDUE_KEY.format(version=version, user=user.id), count, OVERDUE_TIMEOUT)
+
+
+def invalidate_categories():
+    cache.delete(CATEGORY_TREE_KEY)
+
+
+def invalidate_reservations():
+    try:
+        cache.incr(RESERVATIONS_VERSION_KEY)
+    except ValueError:
+        pass
@@ -0,0 +1,124 @@
+import datetime
+from django.core import signing
+from django.db.models import Q
+
+# Lists are paged by the values of their sort keys instead of an offset, so every page is a range scan on the
+# index of the sort keys, however far back it lies. Sort keys must not be nullable; the primary key is appended
+# as tie-break unless the last sort key is unique already.
+
+PAGE_SIZE = 50
+QUERY_PARAMETER = 'q'
+CURSOR_SALT = 'rms.pagination'
+
+
+def _reverse(ordering):
+    return [field[1:] if field.startswith('-') else '-'+field for field in ordering]
+
+
+def _behind(ordering, values):
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        condition |= equal & Q(**{name+('__lt' if field.startswith('-') else '__gt'): value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _encode(obj, ordering):
+    values = []
+    for field in ordering:
+        value = getattr(obj, field.lstrip('-'))
+        values.append(value.isoformat() if isinstance(value, datetime.datetime) else value)
+    return signing.dumps(values, salt=CURSOR_SALT)
+
+
+def _decode(cursor, ordering):
+    try:
+        values = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    return values
+
+
+class KeysetPage:
+
+    def __init__(self, request, object_list, prefix, query, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.prefix = prefix
+        self.query = query
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._params = request.GET
+        self._next_cursor = next_cursor
+        self._previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _querystring(self, **cursor):
+        params = self._params.copy()
+        for key in ('after', 'before'):
+            params.pop(self.prefix+key, None)
+        for key, value in cursor.items():
+            if value is not None:
+                params[self.prefix+key] = value
+        return params.urlencode()
+
+    @property
+    def first_querystring(self):
+        return self._querystring()
+
+    @property
+    def next_querystring(self):
+        return self._querystring(after=self._next_cursor)
+
+    @property
+    def previous_querystring(self):
+        return self._querystring(before=self._previous_cursor)
+
+    @property
+    def filter_params(self):
+        # parameters to keep when the filter changes, cursors of all lists on the page start over
+        return [(key, value) for key, value in self._params.items()
+                if key != QUERY_PARAMETER and not key.endswith('after') and not key.endswith('before')]
+
+
+def paginate(request, queryset, ordering, search_fields=(), prefix='', page_size=PAGE_SIZE):
+    ordering = list(ordering)
+    if not queryset.model._meta.get_field(ordering[-1].lstrip('-')).unique:
+        # in the direction of the last sort key, so an index on the sort keys and id can be scanned backwards
+        ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+
+    query = request.GET.get(QUERY_PARAMETER, '').strip()
+    if query != '' and len(search_fields) > 0:
+        condition = Q()
+        for field in search_fields:
+            condition |= Q(**{field+'__icontains': query})
+        queryset = queryset.filter(condition)
+
+    after = _decode(request.GET.get(prefix+'after', ''), ordering)
+    before = _decode(request.GET.get(prefix+'before', ''), ordering) if after is None else None
+    if before is not None:
+        objects = list(queryset.filter(_behind(_reverse(ordering), before))
+                       .order_by(*_reverse(ordering))[:page_size+1])
+        has_previous, has_next = len(objects) > page_size, True
+        objects = objects[:page_size][::-1]
+    else:
+        if after is not None:
+            queryset = queryset.filter(_behind(ordering, after))
+        objects = list(queryset.order_by(*ordering)[:page_size+1])
+        has_previous, has_next = after is not None, len(objects) > page_size
+        objects = objects[:page_size]
+
+    return KeysetPage(request, objects, prefix, query, has_next, has_previous,
+                      _encode(objects[-1], ordering) if len(objects) > 0 else None,
+                      _encode(objects[0], ordering) if len(objects) > 0 else None)
@@ -0,0 +1,90 @@
+from django.db import connection, transaction
+from django.db.models import Case, When, Value, TextField
+from django.utils import timezone
+from rms import models
+from rms.exceptions import CheckoutError, LockError
+
+# Scanners replay their queue until the sync has been acknowledged, so every event is claimed by its client id
+# first. Events whose id is already known are not applied again but answered with their stored result. Events
+# that could not get their device locks are released again and answered with "retry".
+
+CLAIM_SQL = '''
+    INSERT INTO {scan_event} (client_id, reservation_id, action, inventory_number, scanned_at, synced_at)
+    VALUES {values}
+    ON CONFLICT (client_id) DO NOTHING
+    RETURNING client_id
+'''
+
+
+def _claim(reservation, events):
+    if len(events) == 0:
+        return set()
+    sql = CLAIM_SQL.format(scan_event=models.ScanEvent._meta.db_table,
+                           values=', '.join(['(%s, %s, %s, %s, %s, %s)']*len(events)))
+    synced_at = timezone.now()
+    parameters = []
+    for event in events:
+        parameters.extend([event['id'], reservation.id, event['action'], event['inventory_number'], event['time'],
+                           synced_at])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parameters)
+        return set(row[0] for row in cursor.fetchall())
+
+
+def _apply(reservation, action, events):
+    inventory_numbers = [event['inventory_number'] for event in events]
+    if action == models.ScanEvent.CHECKIN:
+        return reservation.checkin_instances(inventory_numbers)[0]
+    try:
+        return reservation.checkout_instances(inventory_numbers)
+    except CheckoutError as error:
+        return [error]*len(events)
+
+
+def sync(reservation, events):
+    unique_events = {}
+    for event in events:
+        unique_events.setdefault(event['id'], event)
+    # the sort is stable, events scanned at the same time keep the order of the queue
+    ordered = sorted(unique_events.values(), key=lambda event: event['time'])
+
+    errors = {}
+    retry = {}
+    with transaction.atomic():
+        claimed = _claim(reservation, ordered)
+        fresh = [event for event in ordered if event['id'] in claimed]
+        # consecutive events of the same action are applied as one batch
+        group = []
+        for event in fresh+[None]:
+            if len(group) > 0 and (event is None or event['action'] != group[0]['action']):
+                try:
+                    for group_event, error in zip(group, _apply(reservation, group[0]['action'], group)):
+                        errors[group_event['id']] = str(error) if error is not None else None
+                except LockError as error:
+                    for group_event in group:
+                        retry[group_event['id']] = str(error)
+                group = []
+            if event is not None:
+                group.append(event)
+        if len(retry) > 0:
+            models.ScanEvent.objects.filter(client_id__in=retry).delete()
+            claimed -= set(retry)
+        failed = [When(client_id=client_id, then=Value(error)) for client_id, error in errors.items()
+                  if error is not None]
+        if len(failed) > 0:
+            models.ScanEvent.objects.filter(client_id__in=claimed)\
+                .update(error=Case(*failed, default=Value(None), output_field=TextField()))
+
+    stored = dict(models.ScanEvent.objects.filter(client_id__in=set(unique_events)-claimed)
+                  .values_list('client_id', 'error'))
+    results = []
+    for event in events:
+        if event['id'] in retry:
+            results.append({'id': event['id'], 'status': 'retry', 'msg': retry[event['id']]})
+        elif event['id'] in claimed and event is unique_events[event['id']]:
+            status = 'ok' if errors[event['id']] is None else 'error'
+            results.append({'id': event['id'], 'status': status, 'msg': errors[event['id']]})
+        else:
+            error = errors[event['id']] if event['id'] in claimed else stored.get(event['id'])
+            results.append({'id': event['id'], 'status': 'duplicate', 'msg': error})
+    return results
@@ -0,0 +1,137 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.paginator import Paginator
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.urls import reverse
+from rmsv2.settings import COMPANY_SHORT
+from rms import models
+
+# Every searched column has a trigram GIN index on UPPER(column), which is the expression icontains compiles to
+# on PostgreSQL. Related rows are matched with id__in subqueries, so no join multiplies the results.
+
+SECTION_LIMIT = 10
+PAGE_SIZE = 50
+# trigram indexes can not serve patterns shorter than three characters
+TYPEAHEAD_MIN_LENGTH = 3
+TYPEAHEAD_LIMIT = 5
+TYPEAHEAD_MAX_LIMIT = 10
+
+
+def _contains(fields, query):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{field+'__icontains': query})
+    return condition
+
+
+def rank(fields, query):
+    # exact matches before prefix matches before substring matches, earlier fields weigh more
+    conditions = [{field+'__'+lookup: query} for lookup in ('iexact', 'istartswith', 'icontains') for field in fields]
+    return Case(*[When(**condition, then=Value(len(conditions)-index)) for index, condition in enumerate(conditions)],
+                default=Value(0), output_field=IntegerField())
+
+
+def matching_tags(query):
+    return models.Tag.objects.filter(name__icontains=query)
+
+
+def devices(query):
+    tags = matching_tags(query)
+    instances = models.Instance.objects.filter(
+        _contains(['inventory_number', 'serial_number', 'identificial_description'], query) |
+        Q(id__in=models.Instance.tags.through.objects.filter(tag__in=tags).values('instance'))
+    )
+    return models.Device.objects.filter(
+        _contains(['name', 'vendor', 'model_number', 'description'], query) |
+        Q(id__in=models.Device.tags.through.objects.filter(tag__in=tags).values('device')) |
+        Q(id__in=instances.values('device'))
+    ).with_list_data().annotate(rank=rank(['name', 'vendor', 'model_number'], query)).order_by('-rank', 'name', 'id')
+
+
+def reservations(query):
+    return models.Reservation.objects.filter(_contains(['name', 'description'], query)).with_counts()\
+        .prefetch_related('owners').annotate(rank=rank(['name'], query)).order_by('-rank', '-start_date', 'id')
+
+
+def customers(query):
+    addresses = models.Address.objects.filter(_contains(['city', 'street', 'zip_code', 'mailbox'], query))
+    return models.Customer.objects.filter(
+        _contains(['company', 'first_name', 'last_name', 'mail', 'phone', 'mobile'], query) |
+        Q(address__in=addresses) | Q(mailing_address__in=addresses)
+    ).annotate(rank=rank(['last_name', 'first_name', 'company'], query)).order_by('-rank', 'last_name', 'id')
+
+
+SECTIONS = {
+    'devices': ('rms.view_device', devices),
+    'reservations': ('rms.view_reservation', reservations),
+    'customers': ('rms.view_customer', customers),
+}
+
+
+def search(user, query, section=None, page=1):
+    results = {}
+    for name, (permission, queryset) in SECTIONS.items():
+        if not user.has_perm(permission) or (section is not None and section != name):
+            continue
+        if section is None:
+            matches = list(queryset(query)[:SECTION_LIMIT+1])
+            results[name] = {'objects': matches[:SECTION_LIMIT], 'more': len(matches) > SECTION_LIMIT}
+        else:
+            results[name] = {'page': Paginator(queryset(query), PAGE_SIZE).get_page(page)}
+            results[name]['objects'] = results[name]['page'].object_list
+    return results
+
+
+def _suggestions(queryset, fields, query, limit):
+    # ties within a match tier are broken by trigram similarity of the first field
+    return queryset.filter(_contains(fields, query))\
+        .annotate(rank=rank(fields, query), similarity=TrigramSimilarity(fields[0], query))\
+        .order_by('-rank', '-similarity', 'id')[:limit]
+
+
+def _reservation_id(query):
+    if query.upper().startswith(COMPANY_SHORT.upper()+'-'):
+        query = query[len(COMPANY_SHORT)+1:]
+    return int(query) if query.isdecimal() else None
+
+
+def typeahead(user, query, limit=TYPEAHEAD_LIMIT):
+    limit = max(1, min(limit, TYPEAHEAD_MAX_LIMIT))
+    results = {}
+    if len(query) < TYPEAHEAD_MIN_LENGTH:
+        return results
+    if user.has_perm('rms.view_device'):
+        results['devices'] = [{
+            'id': device.id,
+            'text': str(device) if device.vendor else device.name,
+            'url': reverse('device', kwargs={'device_id': device.id}),
+        } for device in _suggestions(models.Device.objects.filter(active=True), ['name', 'vendor', 'model_number'],
+                                     query, limit)]
+        results['instances'] = [{
+            'id': instance.id,
+            'text': '{} {}'.format(instance.inventory_number, instance.device.name),
+            'url': reverse('device_instance', kwargs={'device_id': instance.device_id, 'instance_id': instance.id}),
+        } for instance in _suggestions(models.Instance.objects.select_related('device'),
+                                       ['inventory_number', 'serial_number'], query, limit)]
+    if user.has_perm('rms.view_customer'):
+        results['customers'] = [{
+            'id': customer.id,
+            'text': str(customer) if customer.company is None else '{} ({})'.format(customer, customer.company),
+            'url': reverse('customer', kwargs={'customer_id': customer.id}),
+        } for customer in _suggestions(models.Customer.objects.all(), ['last_name', 'first_name', 'company', 'mail'],
+                                       query, limit)]
+    if user.has_perm('rms.view_reservation'):
+        reservations = models.Reservation.objects.all()
+        reservation_id = _reservation_id(query)
+        if reservation_id is not None:
+            reservations = reservations.filter(Q(id=reservation_id) | _contains(['name'], query))\
+                .annotate(exact=Case(When(id=reservation_id, then=Value(1)), default=Value(0),
+                                     output_field=IntegerField()))\
+                .annotate(rank=rank(['name'], query)).order_by('-exact', '-rank', '-start_date')[:limit]
+        else:
+            reservations = _suggestions(reservations, ['name'], query, limit)
+        results['reservations'] = [{
+            'id': reservation.id,
+            'text': '{} {}'.format(reservation.full_id, reservation.name),
+            'url': reverse('reservation', kwargs={'reservation_id': reservation.id}),
+        } for reservation in reservations]
+    return results
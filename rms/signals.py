@@ -0,0 +1,95 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from rms import models, ledger, tags, navigation
+
+
+@receiver(pre_save, sender=models.ReservationDeviceMembership)
+def remember_device_membership(sender, instance, **kwargs):
+    instance.ledger_previous = None
+    if ledger.enabled() and instance.pk is not None:
+        instance.ledger_previous = sender.objects.filter(pk=instance.pk).values_list('device', 'amount').first()
+
+
+@receiver(post_save, sender=models.ReservationDeviceMembership)
+def book_device_membership(sender, instance, **kwargs):
+    if ledger.enabled():
+        reservation = instance.reservation
+        previous = getattr(instance, 'ledger_previous', None)
+        if previous is not None:
+            ledger.book(previous[0], reservation.start_date, reservation.end_date, -previous[1])
+        ledger.book(instance.device_id, reservation.start_date, reservation.end_date, instance.amount)
+
+
+@receiver(post_delete, sender=models.ReservationDeviceMembership)
+def release_device_membership(sender, instance, **kwargs):
+    if ledger.enabled():
+        reservation = instance.reservation
+        ledger.book(instance.device_id, reservation.start_date, reservation.end_date, -instance.amount)
+
+
+@receiver(post_save, sender=models.ReservationInstanceMembership)
+@receiver(post_save, sender=models.ReservationCheckoutInstance)
+def book_instance(sender, instance, created, **kwargs):
+    if ledger.enabled() and created:
+        reservation = instance.reservation
+        ledger.book(instance.instance.device_id, reservation.start_date, reservation.end_date, 1)
+
+
+@receiver(post_delete, sender=models.ReservationInstanceMembership)
+@receiver(post_delete, sender=models.ReservationCheckoutInstance)
+def release_instance(sender, instance, **kwargs):
+    if ledger.enabled():
+        reservation = instance.reservation
+        ledger.book(instance.instance.device_id, reservation.start_date, reservation.end_date, -1)
+
+
+@receiver(pre_save, sender=models.Instance)
+def remember_instance_device(sender, instance, **kwargs):
+    instance.ledger_previous = None
+    if ledger.enabled() and instance.pk is not None:
+        instance.ledger_previous = sender.objects.filter(pk=instance.pk).values_list('device', flat=True).first()
+
+
+@receiver(post_save, sender=models.Instance)
+def move_instance(sender, instance, **kwargs):
+    # bookings of instances count regardless of rentable and active, only a new device changes the ledger
+    previous = getattr(instance, 'ledger_previous', None)
+    if ledger.enabled() and previous is not None and previous != instance.device_id:
+        ledger.move_instance(instance, previous)
+
+
+@receiver(pre_save, sender=models.Reservation)
+def remember_reservation_dates(sender, instance, **kwargs):
+    instance.ledger_previous = None
+    if ledger.enabled() and instance.pk is not None:
+        instance.ledger_previous = sender.objects.filter(pk=instance.pk).values_list('start_date', 'end_date').first()
+
+
+@receiver(post_save, sender=models.Reservation)
+def move_reservation(sender, instance, **kwargs):
+    previous = getattr(instance, 'ledger_previous', None)
+    if ledger.enabled() and previous is not None and previous != (instance.start_date, instance.end_date):
+        ledger.move_reservation(instance, *previous)
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(m2m_changed, sender=models.Device.tags.through)
+@receiver(m2m_changed, sender=models.Instance.tags.through)
+def invalidate_tags(sender, **kwargs):
+    tags.invalidate()
+
+
+@receiver(post_save, sender=models.Category)
+@receiver(post_delete, sender=models.Category)
+def invalidate_categories(sender, **kwargs):
+    navigation.invalidate_categories()
+
+
+@receiver(post_save, sender=models.Reservation)
+@receiver(post_delete, sender=models.Reservation)
+@receiver(m2m_changed, sender=models.Reservation.owners.through)
+@receiver(post_save, sender=models.ReservationCheckoutInstance)
+@receiver(post_delete, sender=models.ReservationCheckoutInstance)
+def invalidate_reservations(sender, **kwargs):
+    navigation.invalidate_reservations()
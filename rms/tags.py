@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery, IntegerField, Case, When, Value
+from django.db.models.functions import Coalesce
+from rms import models
+
+# Search results are cached per process. Every change of tags or taggings clears the cache of the process doing
+# it, the other processes catch up after CACHE_TTL seconds.
+
+CACHE_SIZE = 256
+CACHE_TTL = 60
+SEARCH_LIMIT = 20
+
+ENSURE_SQL = '''
+    INSERT INTO {tag} (name) SELECT unnest(%s::varchar[])
+    ON CONFLICT (name) DO NOTHING
+    RETURNING name
+'''
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def invalidate():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _cached(key, compute):
+    now = time.monotonic()
+    with _cache_lock:
+        if key in _cache and _cache[key][0] > now:
+            _cache.move_to_end(key)
+            return _cache[key][1]
+    value = compute()
+    with _cache_lock:
+        _cache[key] = (now+CACHE_TTL, value)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def normalize(names):
+    unique_names = []
+    for name in names:
+        name = name.strip()
+        if name != '' and name not in unique_names:
+            unique_names.append(name)
+    return unique_names
+
+
+def ensure(names):
+    names = normalize(names)
+    if len(names) == 0:
+        return names
+    with connection.cursor() as cursor:
+        cursor.execute(ENSURE_SQL.format(tag=models.Tag._meta.db_table), [names])
+        created = cursor.fetchall()
+    if len(created) > 0:
+        invalidate()
+    return names
+
+
+def with_usage(queryset):
+    def usage(through, field):
+        return Coalesce(Subquery(through.objects.filter(tag=OuterRef('pk')).order_by().values('tag')
+                                 .annotate(count=Count(field)).values('count'), output_field=IntegerField()),
+                        Value(0))
+    return queryset.annotate(usage=usage(models.Device.tags.through, 'device') +
+                             usage(models.Instance.tags.through, 'instance'))
+
+
+def search(term, limit=SEARCH_LIMIT):
+    term = term.strip()
+
+    def compute():
+        prefix = Case(When(name__istartswith=term, then=Value(1)), default=Value(0), output_field=IntegerField())
+        tags = with_usage(models.Tag.objects.filter(name__icontains=term)).annotate(prefix=prefix)\
+            .order_by('-prefix', '-usage', 'name')[:limit]
+        return [{'name': tag.name, 'usage': tag.usage} for tag in tags]
+    return _cached((term.lower(), limit), compute)
@@ -1,3 +1,504 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from datetime import datetime, timedelta
+from django.db import connection, transaction, IntegrityError
+from django.core.management import call_command
+from django.db.models import Sum
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, RequestFactory, Client
+from django.urls import reverse
+from django.utils import timezone
+from rms import models, ledger, scans
+from rms.availability import Booking, sweep, usage_timeline, bucket_peaks, free_windows
+from rms.exceptions import ReservationError, CartError, LockError
+from rms.pagination import paginate
 
-# Create your tests here.
+START = timezone.make_aware(datetime(2030, 1, 1))
+
+
+def hours(count):
+    return START+timedelta(hours=count)
+
+
+def create_customer():
+    address = models.Address.objects.create(city='Teststadt', zip_code='00000', street='Teststraße', number='1')
+    mailing_address = models.Address.objects.create(city='Teststadt', zip_code='00000', street='Teststraße',
+                                                    number='1')
+    return models.Customer.objects.create(first_name='Test', last_name='Kunde', mail='test@localhost',
+                                          address=address, mailing_address=mailing_address)
+
+
+def create_device(name, instance_count):
+    device = models.Device.objects.create(name=name, model_number=name, price_new=0, price_rental=0)
+    for number in range(instance_count):
+        models.Instance.objects.create(inventory_number='{}-{}'.format(name, number), broken=False, device=device)
+    return device
+
+
+def create_reservation(customer, start, end, name='Test'):
+    return models.Reservation.objects.create(name=name, customer=customer, start_date=start, end_date=end,
+                                             description='')
+
+
+class SweepTest(TestCase):
+
+    def test_peak_of_overlapping_bookings(self):
+        bookings = [Booking(1, None, 1, hours(0), hours(4), 2),
+                    Booking(1, None, 2, hours(2), hours(6), 1),
+                    Booking(1, None, 3, hours(5), hours(8), 3)]
+        self.assertEqual(sweep(bookings, hours(0), hours(8)), (4, {2, 3}))
+
+    def test_touching_bookings_do_not_collide(self):
+        bookings = [Booking(1, None, 1, hours(0), hours(2), 1),
+                    Booking(1, None, 2, hours(2), hours(4), 1)]
+        self.assertEqual(sweep(bookings, hours(0), hours(4)), (1, {1, 2}))
+
+    def test_bookings_are_clipped_to_the_window(self):
+        bookings = [Booking(1, None, 1, hours(0), hours(3), 1),
+                    Booking(1, None, 2, hours(5), hours(8), 2)]
+        self.assertEqual(sweep(bookings, hours(2), hours(6)), (2, {2}))
+
+
+class AvailabilityTest(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.device = create_device('Mikrofon', 2)
+
+    def test_device_availability(self):
+        first = create_reservation(self.customer, hours(0), hours(4))
+        second = create_reservation(self.customer, hours(2), hours(6))
+        self.device.add_to_reservation(first, 1)
+        self.device.add_to_reservation(second, 1)
+        self.assertEqual(self.device.available_count(hours(2), hours(3)), (0, {first, second}))
+        self.assertEqual(self.device.available_count(hours(4), hours(6)), (1, {second}))
+        self.assertEqual(self.device.available_count(hours(6), hours(8)), (2, set()))
+
+    def test_overbooking_is_rejected(self):
+        self.device.add_to_reservation(create_reservation(self.customer, hours(0), hours(4)), 2)
+        with self.assertRaises(ReservationError):
+            self.device.add_to_reservation(create_reservation(self.customer, hours(3), hours(5)), 1)
+
+
+class HeatmapTest(TestCase):
+
+    def test_bucket_peaks(self):
+        bookings = [Booking(1, None, 1, hours(1), hours(3), 2),
+                    Booking(1, None, 2, hours(2), hours(5), 1)]
+        timeline = usage_timeline(bookings, hours(0), hours(6))
+        buckets = [(hours(index*2), hours(index*2+2)) for index in range(3)]
+        self.assertEqual(bucket_peaks(timeline, buckets), [2, 3, 1])
+
+    def test_hourly_availability(self):
+        device = create_device('Beamer', 2)
+        device.add_to_reservation(create_reservation(create_customer(), hours(1), hours(3)), 2)
+        client = Client()
+        client.force_login(User.objects.create_user('heatmap'))
+        url = reverse('device_availability_json', args=[device.id])
+        response = client.get(url, {'start': hours(0).isoformat(), 'end': hours(4).isoformat(), 'resolution': 'hour'})
+        self.assertEqual([bucket['free'] for bucket in response.json()], [2, 0, 0, 2])
+        response = client.get(url, {'start': hours(0).isoformat(), 'end': (hours(0)+timedelta(minutes=30)).isoformat()})
+        self.assertEqual(response.status_code, 400)
+
+
+class LedgerTest(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(ledger.settings, 'AVAILABILITY_LEDGER', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ledger.rebuild()
+
+    def test_signals_keep_the_ledger_up_to_date(self):
+        customer = create_customer()
+        speaker = create_device('Box', 3)
+        light = create_device('Licht', 2)
+        first = create_reservation(customer, hours(0), hours(4))
+        second = create_reservation(customer, hours(2), hours(6))
+        speaker.add_to_reservation(first, 2)
+        light.instance_set.get(inventory_number='Licht-0').add_to_reservation(first)
+        second.add_lines([{'device': speaker.id, 'amount': 1},
+                          {'instance': light.instance_set.get(inventory_number='Licht-1').id}])
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.peak(speaker, hours(2), hours(3)), 3)
+
+        first.start_date = hours(1)
+        first.end_date = hours(5)
+        first.save()
+        self.assertEqual(ledger.verify(), [])
+        instance = light.instance_set.get(inventory_number='Licht-0')
+        instance.device = speaker
+        instance.save()
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.peak(speaker, hours(2), hours(3)), 4)
+
+        second.checkout_instances(['Licht-1'])
+        self.assertEqual(ledger.verify(), [])
+        second.checkin_instances(['Licht-1'])
+        self.assertEqual(ledger.verify(), [])
+        first.reservationdevicemembership_set.get().delete()
+        self.assertEqual(ledger.verify(), [])
+        self.assertEqual(ledger.peak(speaker, hours(0), hours(8)), 2)
+
+
+class BookingConstraintTest(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.instance = create_device('Mischpult', 1).instance_set.get()
+        self.first = create_reservation(self.customer, hours(0), hours(4))
+        models.ReservationInstanceMembership.objects.create(reservation=self.first, instance=self.instance)
+
+    def assertRejected(self, booking):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            booking()
+
+    def test_periods_follow_the_reservation(self):
+        self.first.start_date = hours(1)
+        self.first.save()
+        membership = self.first.reservationinstancemembership_set.get()
+        self.assertEqual((membership.period.lower, membership.period.upper), (hours(1), hours(4)))
+
+    def test_overlapping_bookings_of_an_instance_are_rejected(self):
+        overlapping = create_reservation(self.customer, hours(3), hours(5))
+        self.assertRejected(lambda: models.ReservationInstanceMembership.objects.create(
+            reservation=overlapping, instance=self.instance))
+        self.assertRejected(lambda: models.ReservationCheckoutInstance.objects.create(
+            reservation=overlapping, instance=self.instance, checkout_date=timezone.now()))
+        models.ReservationCheckoutInstance.objects.create(reservation=self.first, instance=self.instance,
+                                                          checkout_date=timezone.now())
+
+    def test_touching_bookings_are_accepted_until_they_overlap(self):
+        following = create_reservation(self.customer, hours(4), hours(6))
+        models.ReservationCheckoutInstance.objects.create(reservation=following, instance=self.instance,
+                                                          checkout_date=timezone.now())
+
+        def move():
+            following.start_date = hours(3)
+            following.save()
+        self.assertRejected(move)
+
+
+class CartTest(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.device = create_device('Lautsprecher', 2)
+        self.reservation = create_reservation(self.customer, hours(0), hours(4))
+
+    def test_lines_are_booked(self):
+        instance = self.device.instance_set.order_by('inventory_number').first()
+        self.reservation.add_lines([{'device': self.device.id, 'amount': 1}, {'instance': instance.id}])
+        self.assertEqual(self.reservation.reservationdevicemembership_set.get().amount, 1)
+        self.assertEqual(self.reservation.reservationinstancemembership_set.get().instance, instance)
+
+    def test_failing_line_books_nothing(self):
+        with self.assertRaises(CartError) as context:
+            self.reservation.add_lines([{'device': self.device.id, 'amount': 2},
+                                        {'device': self.device.id, 'amount': 1},
+                                        {'device': 0, 'amount': 1}])
+        self.assertEqual([error is None for error in context.exception.line_errors], [True, False, False])
+        self.assertFalse(self.reservation.reservationdevicemembership_set.exists())
+
+
+class FreeWindowTest(TestCase):
+
+    def test_free_windows(self):
+        customer = create_customer()
+        device = create_device('Nebelmaschine', 2)
+        device.add_to_reservation(create_reservation(customer, hours(2), hours(5)), 2)
+        device.add_to_reservation(create_reservation(customer, hours(6), hours(7)), 1)
+        windows = free_windows(device, 1, timedelta(hours=2), hours(0), 3, timedelta(hours=10))
+        self.assertEqual(windows, [(hours(0), hours(2)), (hours(5), hours(7))])
+        windows = free_windows(device, 2, timedelta(hours=2), hours(0), 3, timedelta(hours=10))
+        self.assertEqual(windows, [(hours(0), hours(2)), (hours(7), hours(9))])
+        windows = free_windows(device, 2, timedelta(hours=4), hours(0), 3, timedelta(hours=10))
+        self.assertEqual(windows, [])
+
+    def test_invalid_durations_are_rejected(self):
+        client = Client()
+        client.force_login(User.objects.create_user('windows'))
+        url = reverse('device_free_windows_json', args=[create_device('Nebelmaschine', 1).id])
+        for duration in ['0', '-1', 'nan', 'inf', '1e300', str(24*367)]:
+            self.assertEqual(client.get(url, {'duration': duration}).status_code, 400)
+        self.assertEqual(client.get(url, {'duration': '2', 'after': hours(0).isoformat()}).json(),
+                         [{'start': hours(0).isoformat(), 'end': hours(2).isoformat()}])
+
+
+class BatchCheckoutTest(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer()
+        self.device = create_device('Kamera', 3)
+        start = timezone.now()-timedelta(hours=1)
+        self.reservation = create_reservation(self.customer, start, start+timedelta(days=1))
+        self.device.add_to_reservation(self.reservation, 2)
+
+    def test_batch_checkout(self):
+        errors = self.reservation.checkout_instances(['Kamera-0', 'Kamera-0', 'Kamera-1', 'Unbekannt'])
+        self.assertEqual([error is None for error in errors], [True, False, True, False])
+        self.assertEqual(self.reservation.reservationcheckoutinstance_set.count(), 2)
+        self.assertFalse(self.reservation.reservationdevicemembership_set.exists())
+
+    def test_reserved_instances_are_released(self):
+        instance = self.device.instance_set.get(inventory_number='Kamera-2')
+        instance.add_to_reservation(self.reservation)
+        self.assertEqual(self.reservation.checkout_instances(['Kamera-2']), [None])
+        self.assertFalse(self.reservation.reservationinstancemembership_set.exists())
+        self.assertEqual(self.reservation.reservationdevicemembership_set.get().amount, 2)
+
+    def test_checkout_beyond_the_pool_is_rejected(self):
+        other = create_reservation(self.customer, self.reservation.start_date, self.reservation.end_date)
+        self.device.add_to_reservation(other, 1)
+        errors = self.reservation.checkout_instances(['Kamera-0', 'Kamera-1', 'Kamera-2'])
+        self.assertEqual([error is None for error in errors], [True, True, False])
+        self.assertEqual(errors[2].collisions, {self.reservation, other})
+
+
+class BatchCheckinTest(TestCase):
+
+    def setUp(self):
+        device = create_device('Stativ', 2)
+        start = timezone.now()-timedelta(hours=1)
+        self.reservation = create_reservation(create_customer(), start, start+timedelta(days=1))
+        device.add_to_reservation(self.reservation, 2)
+        self.reservation.checkout_instances(['Stativ-0', 'Stativ-1'])
+
+    def test_batch_checkin(self):
+        errors, leftovers = self.reservation.checkin_instances(['Stativ-0', 'Stativ-0', 'Unbekannt'])
+        self.assertEqual([error is None for error in errors], [True, False, False])
+        self.assertEqual(leftovers, {})
+        self.assertEqual(list(self.reservation.reservationcheckoutinstance_set
+                              .values_list('instance__inventory_number', flat=True)), ['Stativ-1'])
+        self.assertEqual(self.reservation.reservationclearedinstance_set.count(), 1)
+
+    def test_checkin_endpoint(self):
+        client = Client()
+        client.force_login(User.objects.create_user('checkin'))
+        url = reverse('api_reservation_checkin_batch', args=[self.reservation.id])
+        models.AbstractItem.objects.create(reservation=self.reservation, name='Kabel', amount=2)
+        response = client.post(url, json.dumps({'abstract_items': [{'name': 'Kabel', 'amount': 3}]}),
+                               content_type='application/json')
+        self.assertEqual(response.json(), {'results': [], 'abstract_leftovers': {'Kabel': 1}})
+        for body in ['[]', '{}', '{"inventory_numbers": 5}']:
+            self.assertEqual(client.post(url, body, content_type='application/json').status_code, 400)
+
+
+class AbstractItemCheckinTest(TestCase):
+
+    def test_oldest_items_are_returned_first(self):
+        reservation = create_reservation(create_customer(), hours(0), hours(4))
+        for amount, minutes in ((2, 10), (3, 0), (1, 20)):
+            models.AbstractItem.objects.create(reservation=reservation, name='Kabel', amount=amount,
+                                               checkout_date=hours(0)+timedelta(minutes=minutes))
+        leftovers = reservation.checkin_abstract_items({'Kabel': 4, 'Stativ': 1})
+        self.assertEqual(leftovers, {'Stativ': 1})
+        self.assertEqual(list(reservation.abstract_items.order_by('checkout_date')
+                              .values_list('amount', 'checkout_date')),
+                         [(1, hours(0)+timedelta(minutes=10)), (1, hours(0)+timedelta(minutes=20))])
+        self.assertEqual(reservation.checkin_abstract_items({'Kabel': 5}), {'Kabel': 3})
+        self.assertFalse(reservation.abstract_items.exists())
+
+
+class ScanSyncTest(TestCase):
+
+    def setUp(self):
+        device = create_device('Scanner', 2)
+        start = timezone.now()-timedelta(hours=1)
+        self.reservation = create_reservation(create_customer(), start, start+timedelta(days=1))
+        device.add_to_reservation(self.reservation, 2)
+
+    def event(self, client_id, action, inventory_number, minute):
+        return {'id': client_id, 'action': action, 'inventory_number': inventory_number,
+                'time': self.reservation.start_date+timedelta(minutes=minute)}
+
+    def test_replayed_events_are_applied_once(self):
+        events = [self.event('a', models.ScanEvent.CHECKOUT, 'Scanner-0', 1),
+                  self.event('b', models.ScanEvent.CHECKOUT, 'Scanner-0', 2),
+                  self.event('a', models.ScanEvent.CHECKOUT, 'Scanner-0', 1)]
+        results = scans.sync(self.reservation, events)
+        self.assertEqual([result['status'] for result in results], ['ok', 'error', 'duplicate'])
+        results = scans.sync(self.reservation, events[:2]+[self.event('c', models.ScanEvent.CHECKIN, 'Scanner-0', 3)])
+        self.assertEqual([result['status'] for result in results], ['duplicate', 'duplicate', 'ok'])
+        self.assertEqual(results[1]['msg'], 'Das ausgewählte Gerät ist bereits für diese Reservierung ausgeliehen.')
+        self.assertFalse(self.reservation.reservationcheckoutinstance_set.exists())
+        self.assertEqual(self.reservation.reservationclearedinstance_set.count(), 1)
+
+    def test_events_are_applied_in_scan_order(self):
+        events = [self.event('d', models.ScanEvent.CHECKIN, 'Scanner-1', 2),
+                  self.event('e', models.ScanEvent.CHECKOUT, 'Scanner-1', 1)]
+        self.assertEqual([result['status'] for result in scans.sync(self.reservation, events)], ['ok', 'ok'])
+        self.assertEqual(self.reservation.reservationclearedinstance_set.get().instance.inventory_number,
+                         'Scanner-1')
+
+    def test_events_without_device_locks_are_retried(self):
+        events = [self.event('f', models.ScanEvent.CHECKOUT, 'Scanner-0', 1)]
+        with mock.patch('rms.locking.LOCK_ATTEMPTS', 0):
+            self.assertEqual(scans.sync(self.reservation, events)[0]['status'], 'retry')
+        self.assertFalse(models.ScanEvent.objects.exists())
+        self.assertEqual(scans.sync(self.reservation, events)[0]['status'], 'ok')
+
+
+class CategoryTreeTest(TestCase):
+
+    def test_moving_a_category_moves_its_subtree(self):
+        top = models.Category.objects.create(name='Ton')
+        other = models.Category.objects.create(name='Licht')
+        middle = models.Category.objects.create(name='Mikrofone', top_category=top)
+        leaf = models.Category.objects.create(name='Funk', top_category=middle)
+        self.assertEqual(leaf.path, '{}/{}/{}/'.format(top.id, middle.id, leaf.id))
+        self.assertEqual(set(top.subtree_ids()), {top.id, middle.id, leaf.id})
+
+        middle.top_category = other
+        middle.save()
+        leaf.refresh_from_db()
+        self.assertEqual(leaf.path, '{}/{}/{}/'.format(other.id, middle.id, leaf.id))
+        self.assertEqual([category.name for category in leaf.ancestors()], ['Licht', 'Mikrofone', 'Funk'])
+        self.assertEqual(top.subtree_ids(), [top.id])
+
+        middle.top_category = None
+        middle.save()
+        leaf.refresh_from_db()
+        self.assertEqual(leaf.path, '{}/{}/'.format(middle.id, leaf.id))
+
+
+class ReservationStatusTest(TestCase):
+
+    def setUp(self):
+        self.customer = create_customer()
+
+    def status(self, reservation):
+        return models.Reservation.objects.values_list('status', flat=True).get(pk=reservation.pk)
+
+    def test_tick_moves_the_status_along_with_time(self):
+        reservation = create_reservation(self.customer, hours(0), hours(4))
+        reservations = models.Reservation.objects.filter(pk=reservation.pk)
+        self.assertEqual(self.status(reservation), models.Reservation.PLANNED)
+        self.assertEqual(reservations.tick(hours(-1)), 0)
+        self.assertEqual(reservations.tick(hours(1)), 1)
+        self.assertEqual(self.status(reservation), models.Reservation.ACTIVE)
+        self.assertEqual(reservations.tick(hours(2)), 0)
+        self.assertEqual(reservations.tick(hours(5)), 1)
+        self.assertEqual(self.status(reservation), models.Reservation.CLOSED)
+
+    def test_checked_out_reservation_is_overdue_until_checked_in(self):
+        start = timezone.now()-timedelta(days=2)
+        reservation = create_reservation(self.customer, start, start+timedelta(days=1))
+        self.assertEqual(self.status(reservation), models.Reservation.CLOSED)
+        create_device('Kabeltrommel', 1).add_to_reservation(reservation, 1)
+        reservation.checkout_instances(['Kabeltrommel-0'])
+        self.assertEqual(self.status(reservation), models.Reservation.OVERDUE)
+        reservation.checkin_instances(['Kabeltrommel-0'])
+        self.assertEqual(self.status(reservation), models.Reservation.CLOSED)
+
+    def test_tick_command(self):
+        reservation = create_reservation(self.customer, timezone.now()+timedelta(hours=1),
+                                         timezone.now()+timedelta(hours=2))
+        models.Reservation.objects.filter(pk=reservation.pk).update(start_date=timezone.now()-timedelta(hours=1))
+        call_command('tick_reservations', stdout=StringIO())
+        self.assertEqual(self.status(reservation), models.Reservation.ACTIVE)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    workers = 8
+    bookings = 10
+    # half of the bookings can be served, spread over the devices of a run
+    instances = 40
+
+    def book_in_parallel(self, device_count):
+        customer = create_customer()
+        devices = [create_device('Parallel{}-{}'.format(device_count, number), self.instances//device_count)
+                   for number in range(device_count)]
+        reservations = [create_reservation(customer, hours(0), hours(24)) for worker in range(self.workers)]
+        results = {'booked': 0, 'rejected': 0, 'busy': 0}
+        results_lock = threading.Lock()
+
+        def worker(number, reservation):
+            counts = {'booked': 0, 'rejected': 0, 'busy': 0}
+            try:
+                for booking in range(self.bookings):
+                    try:
+                        devices[(number+booking) % device_count].add_to_reservation(reservation, 1)
+                        counts['booked'] += 1
+                    except LockError:
+                        counts['busy'] += 1
+                    except ReservationError:
+                        counts['rejected'] += 1
+            finally:
+                connection.close()
+            with results_lock:
+                for key in counts:
+                    results[key] += counts[key]
+
+        threads = [threading.Thread(target=worker, args=(number, reservation))
+                   for number, reservation in enumerate(reservations)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter()-start
+
+        self.assertEqual(sum(results.values()), self.workers*self.bookings)
+        booked = 0
+        for device in devices:
+            amount = device.reservationdevicemembership_set.aggregate(Sum('amount'))['amount__sum'] or 0
+            self.assertLessEqual(amount, self.instances//device_count)
+            booked += amount
+        self.assertEqual(booked, results['booked'])
+        return self.workers*self.bookings/duration
+
+    def test_parallel_bookings_do_not_overbook(self):
+        for device_count in (1, 2, 8):
+            self.book_in_parallel(device_count)
+
+    def test_throughput_grows_with_distinct_devices(self):
+        # bookings of different devices do not wait for each other's locks
+        self.assertGreater(self.book_in_parallel(8), self.book_in_parallel(1))
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        for number in range(5):
+            customer = create_customer()
+            customer.last_name = 'Kunde {}'.format(number)
+            customer.save()
+        self.factory = RequestFactory()
+
+    def page(self, ordering=('last_name', 'first_name'), **params):
+        return paginate(self.factory.get('/', params), models.Customer.objects.all(), ordering,
+                        search_fields=['last_name'], page_size=2)
+
+    def names(self, page):
+        return [customer.last_name for customer in page]
+
+    def test_pages_forwards_and_backwards(self):
+        page = self.page()
+        self.assertEqual(self.names(page), ['Kunde 0', 'Kunde 1'])
+        self.assertFalse(page.has_previous)
+        page = self.page(after=page._next_cursor)
+        self.assertEqual(self.names(page), ['Kunde 2', 'Kunde 3'])
+        last = self.page(after=page._next_cursor)
+        self.assertEqual(self.names(last), ['Kunde 4'])
+        self.assertFalse(last.has_next)
+        page = self.page(before=last._previous_cursor)
+        self.assertEqual(self.names(page), ['Kunde 2', 'Kunde 3'])
+        self.assertTrue(page.has_previous and page.has_next)
+
+    def test_descending_order_breaks_ties_descending(self):
+        models.Customer.objects.filter(last_name='Kunde 2').update(last_name='Kunde 3')
+        expected = list(models.Customer.objects.order_by('-last_name', '-id').values_list('id', flat=True))
+        page = self.page(ordering=['-last_name'])
+        ids = [customer.id for customer in page]
+        while page.has_next:
+            page = self.page(ordering=['-last_name'], after=page._next_cursor)
+            ids.extend(customer.id for customer in page)
+        self.assertEqual(ids, expected)
+
+    def test_search_and_invalid_cursor(self):
+        self.assertEqual(self.names(self.page(q='kunde 4')), ['Kunde 4'])
+        self.assertEqual(self.names(self.page(after='invalid')), ['Kunde 0', 'Kunde 1'])
@@ -79,12 +79,20 @@ urlpatterns = [
     path('warehouses/<int:warehouse_id>/edit', warehouses_views.edit_warehouse, name='edit_warehouse'),
     path('warehouses/<int:warehouse_id>/delete', warehouses_views.delete_warehouse, name='delete_warehouse'),
 
+    path('api/search/typeahead', typeahead_json, name='api_typeahead'),
     path('api/inventory/tags/search', tag_search_view, name='api_tag_search'),
     path('api/inventory/tags/add', tag_add_view, name='api_tag_add'),
+    path('api/inventory/devices/availability', devices_availability_json, name='devices_availability_json'),
     path('api/inventory/devices/<int:device_id>/reservations/add',
          add_reservation_to_device, name="add_reservation_to_device"),
     path('api/inventory/devices/<int:device_id>/reservations',
          device_reservations_json, name="device_reservations_json"),
+    path('api/inventory/devices/<int:device_id>/availability',
+         device_availability_json, name="device_availability_json"),
+    path('api/inventory/devices/<int:device_id>/freeWindows',
+         device_free_windows_json, name="device_free_windows_json"),
+    path('api/inventory/instances/by-number/<path:inventory_number>',
+         instance_by_number_json, name="instance_by_number_json"),
     path('api/inventory/instances/<int:instance_id>/reservations/add',
          add_instance_to_reservation, name="add_instance_to_reservation"),
     path('api/inventory/instances/<int:instance_id>/reservations',
@@ -92,10 +100,18 @@ urlpatterns = [
 
     path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/devices/<int:device_id>/changeAmount',
          edit_device_reservation, name="edit_device_reservation_amount"),
+    path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/cart',
+         reservation_cart, name='api_reservation_cart'),
     path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/checkout',
          checkout_instance, name='api_reservation_checkout'),
+    path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/checkout/batch',
+         checkout_instances, name='api_reservation_checkout_batch'),
     path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/checkin',
          checkin_instance, name='api_reservation_checkin'),
+    path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/checkin/batch',
+         checkin_instances, name='api_reservation_checkin_batch'),
+    path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/scans/sync',
+         sync_scans, name='api_reservation_sync_scans'),
     path('api/reservations/'+COMPANY_SHORT+'-<int:reservation_id>/checkin_abstract',
          checkin_abstract_item, name="api_reservation_checkin_abstract"),
 
@@ -3,11 +3,15 @@ from django.http import HttpResponse, HttpResponseRedirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.auth.forms import PasswordResetForm
+from django.db import transaction, IntegrityError
 from django.db.models.deletion import ProtectedError
-from django.db.models import Q, ProtectedError
+from django.db.models import ProtectedError
 from rms import forms
 from rms import models
+from rms import pagination
+from rms import search
 from rms.decorators import permission_required
+from rms.locking import lock_devices
 from rms.exceptions import *
 from django.utils import timezone
 from rms.pdf_exporter import PDF
@@ -29,13 +33,11 @@ def redirect_previous(request):
 def get_path(category):
     path = []
     path_urls = []
-    actual_category = category
-    while actual_category is not None:
-        path.append({'text': actual_category.name,
-                     'url': reverse('category', kwargs={'category_id': actual_category.id})})
-        path_urls.append(reverse('category', kwargs={'category_id': actual_category.id}))
-        actual_category = actual_category.top_category
-    path.reverse()
+    if category is not None:
+        for ancestor in category.ancestors():
+            path.append({'text': ancestor.name,
+                         'url': reverse('category', kwargs={'category_id': ancestor.id})})
+            path_urls.append(reverse('category', kwargs={'category_id': ancestor.id}))
 
     if len(path_urls) is 0:
         path_urls.append(reverse('uncategorized'))
@@ -319,22 +321,13 @@ def create_category_view(request, category_id=None):
 def category_view(request, category_id):
     try:
         category = models.Category.objects.get(id=category_id)
-
-        path = []
-        path_urls = []
-        actual_category = category
-        while actual_category is not None:
-            path.append({'text': actual_category.name,
-                         'url': reverse('category', kwargs={'category_id': actual_category.id})})
-            path_urls.append(reverse('category', kwargs={'category_id': actual_category.id}))
-            actual_category = actual_category.top_category
-        path.reverse()
+        path, path_urls = get_path(category)
 
         context = {'title': 'Kategorie: {}'.format(category.name),
                    'path': path,
                    'category_path_urls': path_urls,
                    'category': category,
-                   'devices': category.device_set.filter(active=True)}
+                   'devices': category.device_set.filter(active=True).with_list_data().order_by('name')}
 
         if 'protected_error' in request.GET and request.GET['protected_error'] == '1':
             context['protected_error'] = True
@@ -348,7 +341,7 @@ def category_view(request, category_id):
 @login_required()
 @permission_required('rms.view_category')
 def uncategorized_view(request):
-    return render(request, 'inventory/uncategorized.html', context={'devices': models.Device.uncategorized(),
+    return render(request, 'inventory/uncategorized.html', context={'devices': models.Device.uncategorized().with_list_data().order_by('name'),
                                                                     'title': 'Unkategorisierte Geräte'})
 
 
@@ -432,10 +425,12 @@ def change_password_view(request):
 @login_required()
 @permission_required('auth.view_user')
 def users_list_view(request):
-    users = User.objects.all()
+    page = pagination.paginate(request, User.objects.all(), ['username'],
+                               search_fields=['username', 'first_name', 'last_name', 'email'])
     return render(request, 'settings/users.html', context={'title': 'Benutzer',
                                                            'path': [{'text': 'Benutzer'}],
-                                                           'users': users})
+                                                           'users': page.object_list,
+                                                           'page': page})
 
 
 @login_required()
@@ -532,10 +527,11 @@ def user_password_reset(request, user_id):
 @login_required()
 @permission_required('auth.view_group')
 def groups_list_view(request):
-    groups = Group.objects.all()
+    page = pagination.paginate(request, Group.objects.all(), ['name'], search_fields=['name'])
     return render(request, 'settings/groups.html', context={'title': 'Gruppen',
                                                             'path': [{'text': 'Gruppen'}],
-                                                            'groups': groups})
+                                                            'groups': page.object_list,
+                                                            'page': page})
 
 
 @login_required()
@@ -654,41 +650,15 @@ def search_view(request):
             'search_string': search_string,
             'title': 'Suche {}'.format(search_string)
         }
-        if request.user.has_perm('rms.view_device'):
-            devices = models.Device.objects.filter(Q(instance__identificial_description__icontains=search_string) |
-                                                   Q(instance__inventory_number__icontains=search_string) |
-                                                   Q(instance__serial_number__icontains=search_string) |
-                                                   Q(instance__tags__name__icontains=search_string) |
-                                                   Q(description__icontains=search_string) |
-                                                   Q(name__icontains=search_string) |
-                                                   Q(vendor__icontains=search_string) |
-                                                   Q(model_number__icontains=search_string) |
-                                                   Q(tags__name__icontains=search_string))
-            context['devices'] = set(devices)
+        section = request.GET.get('section')
+        if section not in search.SECTIONS:
+            section = None
+        context['section'] = section
+        context.update(search.search(request.user, search_string, section, request.GET.get('page')))
 
+        if section is None and request.user.has_perm('rms.view_device'):
             context['instance'] = models.Instance.objects.filter(inventory_number=search_string)
 
-        if request.user.has_perm('rms.view_reservation'):
-            reservations = models.Reservation.objects.filter(Q(name__icontains=search_string) |
-                                                             Q(description__icontains=search_string))
-            context['reservations'] = set(reservations)
-
-        if request.user.has_perm('rms.view_customer'):
-            customers = models.Customer.objects.filter(Q(first_name__icontains=search_string) |
-                                                       Q(last_name__icontains=search_string) |
-                                                       Q(mail__icontains=search_string) |
-                                                       Q(phone__icontains=search_string) |
-                                                       Q(mobile__icontains=search_string) |
-                                                       Q(address__city__icontains=search_string) |
-                                                       Q(address__street__icontains=search_string) |
-                                                       Q(address__zip_code__icontains=search_string) |
-                                                       Q(address__mailbox__icontains=search_string) |
-                                                       Q(mailing_address__city__icontains=search_string) |
-                                                       Q(mailing_address__street__icontains=search_string) |
-                                                       Q(mailing_address__zip_code__icontains=search_string) |
-                                                       Q(mailing_address__mailbox__icontains=search_string))
-            context['customers'] = set(customers)
-
         return render(request, 'search.html', context=context)
     else:
         return redirect(request.path)
@@ -697,10 +667,12 @@ def search_view(request):
 @login_required()
 @permission_required('rms.view_customer')
 def customers_view(request):
-    customers = models.Customer.objects.all()
+    page = pagination.paginate(request, models.Customer.objects.all(), ['last_name', 'first_name'],
+                               search_fields=['first_name', 'last_name', 'company', 'mail'])
 
     return render(request, 'customers/customers.html', context={'title': 'Kundendaten',
-                                                                'customers': customers})
+                                                                'customers': page.object_list,
+                                                                'page': page})
 
 
 @login_required()
@@ -832,16 +804,20 @@ def reservations_view(request):
     else:
         reservation_base = request.user.reservation_set
         show_all = False
-    reservation_base.order_by('start_date')
-    actual_reservations = reservation_base.filter(end_date__gte=timezone.now())
-    danger_reservations = reservation_base.filter(end_date__lt=timezone.now())\
-        .exclude(reservationcheckoutinstance=None)
-    past_reservations = reservation_base.filter(end_date__lt=timezone.now(), reservationcheckoutinstance=None)
+    reservations = reservation_base.with_counts().prefetch_related('owners')
+    buckets = {}
+    for bucket, statuses, ordering in [
+        ('actual', [models.Reservation.PLANNED, models.Reservation.ACTIVE], ['start_date']),
+        ('danger', [models.Reservation.OVERDUE], ['start_date']),
+        ('past', [models.Reservation.CLOSED], ['-start_date']),
+    ]:
+        buckets[bucket] = pagination.paginate(request, reservations.filter(status__in=statuses), ordering,
+                                              ['name', 'description'], prefix=bucket+'_')
     reservations_feed_url = request.build_absolute_uri(reverse('reservations_feed'))
     return render(request, 'reservation/reservations.html', context={'title': 'Reservierungen',
-                                                                     'actual_reservations': actual_reservations,
-                                                                     'past_reservations': past_reservations,
-                                                                     'danger_reservations': danger_reservations,
+                                                                     'actual_reservations': buckets['actual'],
+                                                                     'past_reservations': buckets['past'],
+                                                                     'danger_reservations': buckets['danger'],
                                                                      'show_all': show_all,
                                                                      'reservations_feed_url': reservations_feed_url})
 
@@ -870,7 +846,7 @@ def create_reservation_view(request):
 @permission_required('rms.view_reservation')
 def reservation_view(request, reservation_id):
     try:
-        reservation = models.Reservation.objects.get(id=reservation_id)
+        reservation = models.Reservation.objects.with_header_data().get(id=reservation_id)
         return render(request, 'reservation/reservation_reservations.html', context={'title': 'Reservierung',
                                                                                      'reservation': reservation})
     except models.Reservation.DoesNotExist:
@@ -881,7 +857,7 @@ def reservation_view(request, reservation_id):
 @permission_required('rms.change_reservation')
 def reservation_checkout_view(request, reservation_id):
     try:
-        reservation = models.Reservation.objects.get(id=reservation_id)
+        reservation = models.Reservation.objects.with_header_data().get(id=reservation_id)
 
         if request.method == 'POST':
             abstract_item_form = forms.AbstractItemForm(request.POST)
@@ -894,7 +870,8 @@ def reservation_checkout_view(request, reservation_id):
             abstract_item_form = forms.AbstractItemForm()
 
         context = {'title': 'Reservierung Ausleihen', 'reservation': reservation, 'devices': {},
-                   'abstract_item_form': abstract_item_form, 'abstract_items': {}}
+                   'abstract_item_form': abstract_item_form, 'abstract_items': {},
+                   'pick_list': reservation.instances_to_checkout()}
         for instance_relation in reservation.reservationcheckoutinstance_set.all():
             if instance_relation.instance.device not in context['devices']:
                 context['devices'][instance_relation.instance.device] = []
@@ -912,7 +889,7 @@ def reservation_checkout_view(request, reservation_id):
 @permission_required('rms.change_reservation')
 def reservation_checkin_view(request, reservation_id):
     try:
-        reservation = models.Reservation.objects.get(id=reservation_id)
+        reservation = models.Reservation.objects.with_header_data().get(id=reservation_id)
         context = {'title': 'Reservierung Rückgabe', 'reservation': reservation, 'devices': {},
                    'grouped_abstract_items': {}}
         for instance_relation in reservation.reservationclearedinstance_set.all():
@@ -935,9 +912,18 @@ def edit_reservation_view(request, reservation_id):
         reservation = models.Reservation.objects.get(id=reservation_id)
         if request.method == 'POST':
             form = forms.ReservationForm(request.POST, instance=reservation)
-            if form.is_valid():
-                form.save()
-                return redirect('reservation', reservation_id)
+            try:
+                # the availability checks of the form run under the device locks as well, moving the reservation
+                # moves its instance bookings, which the exclusion constraints check
+                with transaction.atomic():
+                    lock_devices(reservation.device_ids())
+                    if form.is_valid():
+                        form.save()
+                        return redirect('reservation', reservation_id)
+            except LockError as error:
+                form.add_error(None, str(error))
+            except IntegrityError:
+                form.add_error(None, 'Die Geräte sind zur ausgewählten Zeit nicht verfügbar.')
         else:
             form = forms.ReservationForm(instance=reservation)
         context = {
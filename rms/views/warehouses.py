@@ -1,13 +1,16 @@
 from django.shortcuts import render, redirect, reverse
+from .. import pagination
 from ..models import Warehouse
 from ..forms import WarehouseForm, AddressForm
 
 
 def table_view(request):
-    warehouses = Warehouse.objects.all()
+    page = pagination.paginate(request, Warehouse.objects.select_related('address'), ['name'],
+                               search_fields=['name', 'address__city'])
     context = {
         'title': 'Lagerorte',
-        'warehouses': warehouses
+        'warehouses': page.object_list,
+        'page': page
     }
     return render(request, 'warehouses/warehouses.html', context=context)
 
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.forms',
+    'django.contrib.postgres',
     'djmoney',
     'rms.apps.RmsConfig',
 ]
@@ -156,6 +157,27 @@ if COMPANY_NAME is None or COMPANY_SHORT is None:
     print('Please specify company name and company short')
     exit(1)
 
+# Availability settings
+
+AVAILABILITY_LEDGER = config.getboolean('availability', 'ledger', fallback=False)
+
+# Cache settings, the cache has to be shared by all processes for invalidations to reach them
+
+if config.get('cache', 'memcached', fallback=None) is not None:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': config.get('cache', 'memcached'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'rms_cache',
+        }
+    }
+
 # Email settings
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'